@@ -0,0 +1,201 @@
+# Ask a GTP engine about every position in game records, writing its answers into the files.
+#
+# Usage: python -m gofish.annotate --engine "gnugo --mode gtp" <files> [--engines N] [--mainline]
+#                                  [--command "genmove {colour}"] [--property C] [--output DIR]
+#                                  [--cache DB] [--trace FILE]
+#
+# The command is sent at every node, with {colour} replaced by the side to move. Each answer
+# is added to the node's comment, or with --property set to some other key, stored as that
+# property's value. Files are saved as <name>_annotated.sgf, beside the originals unless
+# --output is given.
+#
+# The tree is split into lines: the main line, then for every other child of a branch point,
+# the line from that child down its own first children. Each line is one job for the engine
+# pool. Each engine keeps an EngineSync (see gtp_sync.py), so within a line it follows along
+# with play, and a line starting at a branch point the engine has already seen only needs
+# undo back to that point.
+#
+# With --cache, answers are also looked up in (and added to) a ResponseCache, see gtp_cache.py.
+# The engine is only synced when an answer isn't cached, so a line that's entirely in the
+# cache never touches the engine at all.
+#
+# --trace writes a JSONL transcript of the GTP traffic, with a latency summary at the end
+# (see gtp_trace.py).
+
+import argparse, asyncio, os, shlex, sys
+
+from gofish.compress import *
+from gofish.fastboard import *
+from gofish.gtp import *
+from gofish.gtp_cache import *
+from gofish.gtp_pool import *
+from gofish.gtp_sync import *
+from gofish.gtp_trace import *
+from gofish.loader import *
+
+DEFAULT_COMMAND = "genmove {colour}"
+
+def tree_lines(root, mainline_only = False):    # Returns a list of lists of nodes, together covering the tree once each
+
+    lines = []
+    starts = [root]
+
+    while starts:
+        node = starts.pop()
+        line = [node]
+        while node.children:
+            if not mainline_only:
+                starts.extend(reversed(node.children[1:]))
+            node = node.children[0]
+            line.append(node)
+        lines.append(line)
+
+    return lines
+
+
+def line_job(line, command, syncs, cache = None, identity = None):
+
+    # Returns a job for the pool. syncs is a dict of Engine ---> EngineSync, shared by all
+    # jobs. Answers are collected and only returned at the end, so a job that's retried on
+    # a restarted engine can't write anything twice.
+
+    async def job(engine):
+
+        if engine not in syncs:
+            for dead in [e for e in syncs if not e.running]:       # Replaced by the pool, never to be seen again
+                del syncs[dead]
+            syncs[engine] = EngineSync(engine)
+        sync = syncs[engine]
+
+        root = line[0].get_root_node()
+        boardsize = root.boardsize
+        komi = root.get_value("KM") or 0
+
+        board = None
+        if cache:
+            board = FastBoard(boardsize)
+            for node in line[0].node_path()[:-1]:
+                play_on_fastboard(board, node_moves(node, boardsize))
+
+        undo = "genmove" in command.split()[0].lower()         # e.g. also kgs-genmove_cleanup; these all play the move
+        answers = []
+
+        for node in line:
+
+            colour = colour_to_move(node)
+            text = command.format(colour = colour_names[colour])
+
+            if cache:
+                play_on_fastboard(board, node_moves(node, boardsize))
+                key = position_key(board, colour, komi)
+                answer = cache.get(identity, key, text)
+                if answer is not None:
+                    answers.append((node, answer))
+                    continue
+
+            await sync.sync(node)
+            answer = await sync.ask(text, undo = undo)
+            if cache:
+                cache.put(identity, key, text, answer)
+            answers.append((node, answer))
+
+        return answers
+
+    return job
+
+
+def play_on_fastboard(board, moves):
+    for colour, x, y in moves:
+        if x:
+            board.play_move(colour, x, y)
+        else:
+            board.play_pass()
+
+
+def record_answer(node, answer, key, label):
+    if key == "C":
+        node.add_to_comment_bottom("{}: {}".format(label, answer))
+    else:
+        node.set_value(key, answer)
+
+
+def annotated_filename(path, output_dir = None):
+    name = os.path.splitext(strip_compression_extension(os.path.basename(path)))[0] + "_annotated.sgf"
+    return os.path.join(output_dir if output_dir else os.path.dirname(path), name)
+
+
+async def annotate_files(paths, engine_args, engines = None, mainline_only = False, command = DEFAULT_COMMAND, key = "C", output_dir = None, cache = None, tracer = None):
+
+    # Returns the number of lines that failed (e.g. an illegal move the engine refused), plus
+    # the number of files that couldn't be loaded or saved.
+    # cache, if given, is a ResponseCache; tracer a Tracer. Only a few files are loaded at a
+    # time (one per engine), and each is saved as soon as its lines are done.
+
+    failures = 0
+    label = command.split()[0]
+    paths = iter(paths)
+
+    async with EnginePool(engine_args, engines = engines, tracer = tracer) as pool:
+
+        identity = await pool.submit(engine_identity) if cache else None
+        syncs = dict()
+
+        async def file_worker():
+            nonlocal failures
+            for path in paths:                  # Shared by all the file workers
+                try:
+                    root = load(path)
+                    results = await pool.map([line_job(line, command, syncs, cache, identity) for line in tree_lines(root, mainline_only)])
+                    for answers in results:
+                        if isinstance(answers, Exception):
+                            print("{}: {}".format(path, answers), file = sys.stderr)
+                            failures += 1
+                            continue
+                        for node, answer in answers:
+                            record_answer(node, answer, key, label)
+                    save_file(annotated_filename(path, output_dir), root)
+                except Exception as err:        # Any failure on one file is reported, not raised
+                    print("{}: {}: {}".format(path, type(err).__name__, err), file = sys.stderr)
+                    failures += 1
+
+        await asyncio.gather(*[file_worker() for __ in pool.engines])
+
+    return failures
+
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description = "Annotate every position of game records with a GTP engine's answers.")
+    parser.add_argument("files", nargs = "+")
+    parser.add_argument("--engine", required = True, help = "the engine's command line, as one string")
+    parser.add_argument("--engines", type = int, default = None, help = "how many copies of the engine to run")
+    parser.add_argument("--mainline", action = "store_true", help = "only the main line of each file")
+    parser.add_argument("--command", default = DEFAULT_COMMAND, help = "sent at each node; {colour} is replaced by the side to move")
+    parser.add_argument("--property", default = "C", help = "where answers go; C adds to the comment")
+    parser.add_argument("--output", default = None, metavar = "DIR")
+    parser.add_argument("--cache", default = None, metavar = "DB", help = "an SQLite file of cached engine answers, created if needed")
+    parser.add_argument("--trace", default = None, metavar = "FILE", help = "write a JSONL transcript of the GTP traffic")
+    args = parser.parse_args()
+
+    if args.output:
+        os.makedirs(args.output, exist_ok = True)
+
+    cache = ResponseCache(args.cache) if args.cache else None
+    tracer = Tracer(args.trace) if args.trace else None
+
+    failures = asyncio.run(annotate_files(args.files, shlex.split(args.engine), engines = args.engines, mainline_only = args.mainline,
+                                          command = args.command, key = args.property, output_dir = args.output, cache = cache, tracer = tracer))
+
+    if cache:
+        print("cache: {} hits, {} misses ({:.1%})".format(cache.hits, cache.misses, cache.hit_rate()), file = sys.stderr)
+        cache.close()
+    if tracer:
+        tracer.close()
+
+    if failures:
+        print("{} lines or files could not be annotated".format(failures), file = sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# An SQLite index of a directory of game records, so questions about the collection can be
+# answered without loading any files.
+#
+# Usage: python -m gofish.archive index <directory> [--db FILE] [--workers N]
+#        python -m gofish.archive query [--db FILE] [--player NAME] [--black NAME] [--white NAME] [--result B+] ...
+#
+# Indexing is incremental: a file is only loaded again if its mtime or size has changed, and
+# files that have disappeared are dropped from the index.
+
+import argparse, os, sqlite3, sys
+
+from gofish.batch import *
+from gofish.loader import *
+
+DEFAULT_DB = "gofish_archive.db"
+
+indexed_properties = ["PB", "PW", "BR", "WR", "RE", "DT", "KM", "SZ", "HA", "EV", "GN", "PC", "RU"]
+
+schema = """
+CREATE TABLE IF NOT EXISTS games (
+    path        TEXT PRIMARY KEY,
+    mtime       INTEGER NOT NULL,
+    size        INTEGER NOT NULL,
+    ok          INTEGER NOT NULL,
+    error       TEXT,
+    dyer        TEXT,
+    moves       INTEGER,
+    {}
+);
+CREATE INDEX IF NOT EXISTS games_pb ON games (PB);
+CREATE INDEX IF NOT EXISTS games_pw ON games (PW);
+CREATE INDEX IF NOT EXISTS games_dyer ON games (dyer);
+""".format(",\n    ".join("{} TEXT".format(key) for key in indexed_properties))
+
+
+def open_archive(db_filename = DEFAULT_DB):
+    conn = sqlite3.connect(db_filename)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(schema)
+    return conn
+
+
+def index_task(path):           # Runs in a worker process
+    stat = os.stat(path)
+    root = load_sgf_mainline(path)
+    record = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "dyer": root.dyer(), "moves": root.get_end_node().moves_made}
+    for key in indexed_properties:
+        record[key] = root.get_value(key)
+    return record
+
+
+def index_archive(conn, directory, workers = None, chunk_size = 64):
+
+    # Returns (added_or_updated, unchanged, removed, errors)
+
+    directory = os.path.abspath(directory)      # Paths are stored absolute, so the same file always has the same key
+
+    known = dict()
+    for row in conn.execute("SELECT path, mtime, size FROM games"):
+        known[row["path"]] = (row["mtime"], row["size"])
+
+    to_load = []
+    unchanged = 0
+    seen = set()
+
+    for path in find_files(directory):
+        seen.add(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if known.get(path) == (stat.st_mtime_ns, stat.st_size):
+            unchanged += 1
+        else:
+            to_load.append(path)
+
+    columns = ["path", "mtime", "size", "ok", "error", "dyer", "moves"] + indexed_properties
+    sql = "INSERT OR REPLACE INTO games ({}) VALUES ({})".format(", ".join(columns), ", ".join("?" * len(columns)))
+
+    updated = 0
+    errors = 0
+
+    for record in run_batch(index_task, to_load, workers = workers, chunk_size = chunk_size):
+        if not record["ok"]:
+            errors += 1
+            try:
+                stat = os.stat(record["path"])
+                record["mtime"], record["size"] = stat.st_mtime_ns, stat.st_size
+            except OSError:
+                continue
+            record["error"] = "{}: {}".format(record["error"], record["message"])
+        conn.execute(sql, [record.get(column) for column in columns])
+        updated += 1
+
+    # Only files under the indexed directory can have vanished as a result of this run...
+
+    prefix = os.path.join(directory, "")
+    removed = [path for path in known if path.startswith(prefix) and path not in seen]
+    conn.executemany("DELETE FROM games WHERE path = ?", [(path,) for path in removed])
+
+    conn.commit()
+    return updated, unchanged, len(removed), errors
+
+
+def find_games(conn, player = None, black = None, white = None, result = None, dyer = None,
+               date = None, min_moves = None, max_moves = None, include_errors = False):
+
+    # Returns a list of sqlite3.Row. result and date match as prefixes, e.g. "B+" or "2019-05".
+
+    clauses = []
+    params = []
+
+    if player is not None:
+        clauses.append("(PB = ? OR PW = ?)")
+        params += [player, player]
+    if black is not None:
+        clauses.append("PB = ?")
+        params.append(black)
+    if white is not None:
+        clauses.append("PW = ?")
+        params.append(white)
+    if result is not None:
+        clauses.append("RE LIKE ? ESCAPE '\\'")
+        params.append(like_prefix(result))
+    if date is not None:
+        clauses.append("DT LIKE ? ESCAPE '\\'")
+        params.append(like_prefix(date))
+    if dyer is not None:
+        clauses.append("dyer = ?")
+        params.append(dyer)
+    if min_moves is not None:
+        clauses.append("moves >= ?")
+        params.append(min_moves)
+    if max_moves is not None:
+        clauses.append("moves <= ?")
+        params.append(max_moves)
+    if not include_errors:
+        clauses.append("ok = 1")
+
+    sql = "SELECT * FROM games"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY path"
+
+    return conn.execute(sql, params).fetchall()
+
+
+def like_prefix(s):
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description = "Index a directory of game records in SQLite, and query the index.")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+
+    index_parser = subparsers.add_parser("index")
+    index_parser.add_argument("directory")
+    index_parser.add_argument("--db", default = DEFAULT_DB)
+    index_parser.add_argument("--workers", type = int, default = None)
+
+    query_parser = subparsers.add_parser("query")
+    query_parser.add_argument("--db", default = DEFAULT_DB)
+    for arg in ["player", "black", "white", "result", "dyer", "date"]:
+        query_parser.add_argument("--" + arg, default = None)
+    query_parser.add_argument("--min-moves", type = int, default = None)
+    query_parser.add_argument("--max-moves", type = int, default = None)
+
+    args = parser.parse_args()
+    conn = open_archive(args.db)
+
+    if args.command == "index":
+        updated, unchanged, removed, errors = index_archive(conn, args.directory, workers = args.workers)
+        print("{} indexed ({} with errors), {} unchanged, {} removed".format(updated, errors, unchanged, removed), file = sys.stderr)
+    else:
+        rows = find_games(conn, player = args.player, black = args.black, white = args.white, result = args.result,
+                          dyer = args.dyer, date = args.date, min_moves = args.min_moves, max_moves = args.max_moves)
+        for row in rows:
+            print("\t".join(str(row[key]) if row[key] is not None else "" for key in ["path", "PB", "PW", "RE", "DT", "moves"]))
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
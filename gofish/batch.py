@@ -0,0 +1,158 @@
+# Loading whole directories of game records across several processes.
+#
+# Usage: python -m gofish.batch <directory> [--mode header|mainline|tree] [--workers N] [--chunk N] [--output FILE]
+#
+# Results stream back as dicts, one per file, in whatever order the workers finish. A file that
+# fails to load gives a record with "ok" set to False and the error, rather than an exception.
+
+import argparse, base64, concurrent.futures, json, os, sys, time
+
+from gofish.bintree import *
+from gofish.compress import *
+from gofish.loader import *
+
+game_extensions = (".sgf", ".gib", ".ngf", ".ugf", ".ugi")
+
+def find_files(directory, extensions = game_extensions):     # Compressed files count if the name below the compression matches
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if strip_compression_extension(filename).lower().endswith(extensions):
+                yield os.path.join(dirpath, filename)
+
+# ---------------------------------------------------------------------------
+# Tasks take a path and return a dict. They must be module-level functions so they can be pickled.
+
+def header_task(path):
+    root = load_header(path)
+    return {"properties": root.properties}
+
+
+def mainline_task(path):
+    root = load_sgf_mainline(path)
+    return {"properties": root.properties, "moves": main_line_moves(root)}
+
+
+def tree_task(path):
+    root = load(path)
+    return {"tree": encode_tree(root)}         # Much faster to move between processes than a pickled Node tree
+
+
+modes = {
+    "header": header_task,
+    "mainline": mainline_task,
+    "tree": tree_task,
+}
+
+def run_task(task, path):
+    record = {"path": path}
+    try:
+        record.update(task(path))
+        record["ok"] = True
+    except Exception as e:                      # Any failure on one file is reported, not raised
+        record["ok"] = False
+        record["error"] = type(e).__name__
+        record["message"] = str(e)
+    return record
+
+
+def run_chunk(task, paths):
+    return [run_task(task, path) for path in paths]
+
+
+def run_batch(task, paths, workers = None, chunk_size = 64, max_pending = None):
+
+    # Hand the paths to a process pool in chunks, keeping at most max_pending chunks submitted
+    # at once (so a huge list of paths, or a generator, is never turned into futures all at
+    # once), and yield each record as soon as its chunk finishes.
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = workers * 2
+
+    paths = iter(paths)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+
+        pending = set()
+
+        while 1:
+            while len(pending) < max_pending:
+                chunk = [path for __, path in zip(range(chunk_size), paths)]
+                if not chunk:
+                    break
+                pending.add(executor.submit(run_chunk, task, chunk))
+
+            if not pending:
+                return
+
+            done, pending = concurrent.futures.wait(pending, return_when = concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+def batch_load(paths, mode = "header", workers = None, chunk_size = 64):
+    return run_batch(modes[mode], paths, workers = workers, chunk_size = chunk_size)
+
+# ---------------------------------------------------------------------------
+
+class Throughput():                 # Counts records and prints a progress line every few seconds
+
+    def __init__(self, outfile = sys.stderr, interval = 5):
+        self.outfile = outfile
+        self.interval = interval
+        self.start = time.monotonic()
+        self.last_report = self.start
+        self.files = 0
+        self.errors = 0
+
+    def add(self, record):
+        self.files += 1
+        if not record["ok"]:
+            self.errors += 1
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def report(self):
+        elapsed = time.monotonic() - self.start
+        rate = self.files / elapsed if elapsed > 0 else 0
+        print("{} files, {} errors, {:.1f} s, {:.1f} files/s".format(self.files, self.errors, elapsed, rate), file = self.outfile)
+
+
+def json_record(record):
+    record = dict(record)
+    if "moves" in record:
+        record["moves"] = record["moves"].tolist()
+    if "tree" in record:
+        record["tree"] = base64.b64encode(record["tree"]).decode("ascii")
+    return json.dumps(record, ensure_ascii = False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Load a directory tree of game records in parallel, writing one JSON line per file.")
+    parser.add_argument("directory")
+    parser.add_argument("--mode", choices = sorted(modes), default = "header")
+    parser.add_argument("--workers", type = int, default = None)
+    parser.add_argument("--chunk", type = int, default = 64, help = "files per task sent to a worker")
+    parser.add_argument("--output", default = None, help = "output file (default stdout)")
+    args = parser.parse_args()
+
+    outfile = open(args.output, "w", encoding = "utf-8") if args.output else sys.stdout
+    throughput = Throughput()
+
+    try:
+        for record in batch_load(find_files(args.directory), args.mode, workers = args.workers, chunk_size = args.chunk):
+            outfile.write(json_record(record) + "\n")
+            throughput.add(record)
+    finally:
+        if outfile is not sys.stdout:
+            outfile.close()
+
+    throughput.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# A compact binary form of a Node tree, for reloading big files without parsing them again.
+#
+# Layout (all integers little-endian, every section 4-byte aligned, so the file can be mmapped):
+#
+#   header          magic, version, source size, source mtime, node / entry / string counts
+#   string lengths  uint32 per string (length in characters)
+#   parents         int32 per node, in preorder; -1 for the root
+#   entry starts    uint32 per node, plus one at the end
+#   entries         (key, value) pairs of uint32 indexes into the string table
+#   string data     every string, UTF-8 encoded, back to back
+#
+# Each distinct key and value is stored once, so moves such as "pd" become small integers
+# and the decoded tree shares a single str object for each of them.
+
+import array, mmap, os, struct, sys
+
+from gofish.constants import *
+from gofish.tree import *
+
+BINTREE_MAGIC = b"GFT1"
+BINTREE_VERSION = 1
+
+header_struct = struct.Struct("<4sIQqIII")
+
+
+def int_array(typecode, data):
+    arr = array.array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr
+
+
+def int_bytes(arr):
+    if sys.byteorder != "little":
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def encode_tree(node, source_size = 0, source_mtime = 0):
+
+    string_index = dict()
+    strings = []
+
+    def intern(s):
+        try:
+            return string_index[s]
+        except KeyError:
+            string_index[s] = len(strings)
+            strings.append(s)
+            return len(strings) - 1
+
+    parents = array.array("i")
+    entry_starts = array.array("I")
+    entries = array.array("I")
+
+    stack = [(node, -1)]
+
+    while stack:
+        node, parent_index = stack.pop()
+        index = len(parents)
+        parents.append(parent_index)
+        entry_starts.append(len(entries) // 2)
+        for key, values in node.properties.items():
+            key_id = intern(key)
+            for value in values:
+                entries.append(key_id)
+                entries.append(intern(value))
+        for child in reversed(node.children):   # Reversed so they come off the stack in order
+            stack.append((child, index))
+
+    entry_starts.append(len(entries) // 2)
+
+    lengths = array.array("I", [len(s) for s in strings])
+
+    header = header_struct.pack(BINTREE_MAGIC, BINTREE_VERSION, source_size, source_mtime, len(parents), len(entries) // 2, len(strings))
+
+    return b"".join([header, int_bytes(lengths), int_bytes(parents), int_bytes(entry_starts), int_bytes(entries),
+                     "".join(strings).encode("utf-8", errors="surrogatepass")])
+
+
+def read_bintree_header(data):          # Returns (source_size, source_mtime, node_count, entry_count, string_count)
+    if len(data) < header_struct.size:
+        raise ParserFail
+    magic, version, source_size, source_mtime, node_count, entry_count, string_count = header_struct.unpack_from(data)
+    if magic != BINTREE_MAGIC or version != BINTREE_VERSION:
+        raise ParserFail
+    return source_size, source_mtime, node_count, entry_count, string_count
+
+
+def decode_tree(data):                  # data can be bytes or anything sliceable into bytes, e.g. an mmap
+
+    __, __, node_count, entry_count, string_count = read_bintree_header(data)
+
+    offset = header_struct.size
+    sections = []
+    for typecode, count in [("I", string_count), ("i", node_count), ("I", node_count + 1), ("I", entry_count * 2)]:
+        sections.append(int_array(typecode, data[offset:offset + count * 4]))
+        offset += count * 4
+
+    lengths, parents, entry_starts, entries = sections
+
+    text = data[offset:].decode("utf-8", errors="surrogatepass")
+    strings = []
+    i = 0
+    for length in lengths:
+        strings.append(text[i:i + length])
+        i += length
+
+    if len(parents) != node_count or len(entries) != entry_count * 2 or i != len(text):
+        raise ParserFail
+
+    nodes = []
+
+    for n in range(node_count):
+        parent_index = parents[n]
+        node = Node(parent = nodes[parent_index] if parent_index >= 0 else None)
+        properties = node.properties
+        for e in range(entry_starts[n], entry_starts[n + 1]):
+            key = strings[entries[e * 2]]
+            if key in properties:
+                properties[key].append(strings[entries[e * 2 + 1]])
+            else:
+                properties[key] = [strings[entries[e * 2 + 1]]]
+        nodes.append(node)
+
+    if len(nodes) == 0:
+        raise ParserFail
+
+    root = nodes[0]
+    root.is_main_line = True
+    root.update_recursive(update_board = False)
+    return root
+
+
+def save_binary(filename, node, source_size = 0, source_mtime = 0):
+    data = encode_tree(node, source_size, source_mtime)
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as outfile:
+        outfile.write(data)
+    os.replace(tmp_filename, filename)      # So a reader never sees a half-written file
+
+
+def load_binary(filename):
+    with open(filename, "rb") as infile:
+        with mmap.mmap(infile.fileno(), 0, access = mmap.ACCESS_READ) as data:
+            return decode_tree(data)
+
+# ---------------------------------------------------------------------------
+# The sidecar cache sits next to the source file. It records the source's size and mtime,
+# and is only used while both still match.
+
+def cache_filename(filename):
+    return filename + ".gftree"
+
+
+def load_cache(filename):           # Returns None if there is no usable cache
+    try:
+        stat = os.stat(filename)
+        with open(cache_filename(filename), "rb") as infile:
+            with mmap.mmap(infile.fileno(), 0, access = mmap.ACCESS_READ) as data:
+                source_size, source_mtime, __, __, __ = read_bintree_header(data)
+                if source_size != stat.st_size or source_mtime != stat.st_mtime_ns:
+                    return None
+                return decode_tree(data)
+    except (OSError, ValueError, ParserFail):
+        return None
+
+
+def save_cache(filename, node):     # Failing to write the cache (e.g. read-only directory) is not an error
+    try:
+        stat = os.stat(filename)
+        save_binary(cache_filename(filename), node.get_root_node(), stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        pass
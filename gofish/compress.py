@@ -0,0 +1,61 @@
+# Transparent handling of gzip, bz2 and xz compressed files. When reading, the compression
+# is detected from the first few bytes of the file, not the extension. When writing, there
+# is nothing to sniff, so the extension decides.
+
+import bz2, gzip, lzma
+
+magic_numbers = [
+    (b"\x1f\x8b",                   gzip),
+    (b"BZh",                        bz2),
+    (b"\xfd7zXZ\x00",               lzma),
+]
+
+extensions = {
+    ".gz":  gzip,
+    ".bz2": bz2,
+    ".xz":  lzma,
+}
+
+def compression_from_bytes(head):           # Returns the module needed to decompress, or None
+    for magic, module in magic_numbers:
+        if head.startswith(magic):
+            return module
+    return None
+
+
+def compression_from_filename(filename):
+    for ext, module in extensions.items():
+        if filename.lower().endswith(ext):
+            return module
+    return None
+
+
+def open_binary(filename):
+
+    # Open a file for reading bytes. Compressed files are decompressed on the fly as they
+    # are read, so there is never a temporary file or a full decompressed copy in memory
+    # unless the caller reads the whole thing.
+
+    infile = open(filename, "rb")
+    module = compression_from_bytes(infile.read(6))
+
+    if module is None:
+        infile.seek(0)
+        return infile
+
+    infile.close()
+    return module.open(filename, "rb")
+
+
+def open_text_for_writing(filename, encoding = "utf-8"):
+    module = compression_from_filename(filename)
+    if module is None:
+        return open(filename, "w", encoding = encoding)
+    return module.open(filename, "wt", encoding = encoding)
+
+
+def strip_compression_extension(filename):     # "foo.sgf.gz"   --->    "foo.sgf"
+    module = compression_from_filename(filename)
+    if module is None:
+        return filename
+    return filename[:filename.rindex(".")]
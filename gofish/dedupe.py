@@ -0,0 +1,144 @@
+# Finding duplicate games in a collection, by their moves alone (so differing player names,
+# dates, comments and so on don't matter), including records that are a truncated copy of
+# another game.
+#
+# Usage: python -m gofish.dedupe <directory> [--workers N] [--output FILE]
+#
+# Each file is reduced, in a worker process, to its Dyer signature and a set of hashes of its
+# main line: one for the whole line, and one at every CHECKPOINT moves. Games are bucketed by
+# the hash of their first KEY_MOVES moves. Within a bucket a game joins a group if it matches
+# the group's longest game at the end (if the two are the same length), or else if its moves
+# are exactly the start of the longer game's: the deepest shared checkpoint is compared
+# first, then the moves themselves. Memory is the longest game's moves (2 bytes a move) and a
+# few hashes per group.
+
+import argparse, array, hashlib, json, sys
+
+from gofish.batch import *
+from gofish.loader import *
+
+CHECKPOINT = 16
+KEY_MOVES = 48
+
+def line_hashes(root, moves):       # Returns (checkpoint hashes, full hash), as signed 64 bit ints
+
+    hasher = hashlib.blake2b(digest_size = 8)
+    hasher.update(root.get_value("SZ").encode("ascii"))
+    for key in ["AB", "AW"]:
+        hasher.update("{}{}".format(key, sorted(root.get_all_values(key))).encode("utf-8"))
+
+    checkpoints = array.array("q")
+    for start in range(0, len(moves) - len(moves) % CHECKPOINT, CHECKPOINT):
+        hasher.update(moves[start:start + CHECKPOINT].tobytes())
+        checkpoints.append(int.from_bytes(hasher.copy().digest(), "little", signed = True))
+    hasher.update(moves[len(moves) - len(moves) % CHECKPOINT:].tobytes())
+
+    return checkpoints, int.from_bytes(hasher.digest(), "little", signed = True)
+
+
+def signature_task(path):           # Runs in a worker process
+    root = load_sgf_mainline(path)
+    moves = main_line_moves(root)
+    checkpoints, full = line_hashes(root, moves)
+    return {"dyer": root.dyer(), "length": len(moves), "checkpoints": checkpoints, "full": full, "moves": moves.tobytes()}
+
+
+class Group():
+    def __init__(self, record):
+        self.paths = []
+        self.exact = True               # False once a truncated copy has joined
+        self.dyer = record["dyer"]
+        self.length = record["length"]
+        self.checkpoints = record["checkpoints"]
+        self.full = record["full"]
+        self.moves = record["moves"]
+        self.paths.append(record["path"])
+
+    def matches(self, record):
+        if record["length"] == self.length:
+            return record["full"] == self.full
+        shared = min(len(record["checkpoints"]), len(self.checkpoints))
+        if shared == 0:
+            return False
+        if record["checkpoints"][shared - 1] != self.checkpoints[shared - 1]:     # Also covers SZ, AB and AW
+            return False
+        shorter, longer = sorted([record["moves"], self.moves], key = len)      # The checkpoint can't see the last few moves
+        return longer.startswith(shorter)
+
+    def add(self, record):
+        self.paths.append(record["path"])
+        if record["length"] != self.length:
+            self.exact = False
+        if record["length"] > self.length:      # The longest game is the one later games are compared against
+            self.dyer = record["dyer"]
+            self.length = record["length"]
+            self.checkpoints = record["checkpoints"]
+            self.full = record["full"]
+            self.moves = record["moves"]
+
+
+class Deduper():
+
+    def __init__(self):
+        self.buckets = dict()
+        self.games = 0
+
+    def add(self, record):
+        self.games += 1
+        if len(record["checkpoints"]) >= KEY_MOVES // CHECKPOINT:
+            key = record["checkpoints"][KEY_MOVES // CHECKPOINT - 1]
+        else:
+            key = record["full"]                # Short games can only match exact copies
+        groups = self.buckets.setdefault(key, [])
+        for group in groups:
+            if group.matches(record):
+                group.add(record)
+                return
+        groups.append(Group(record))
+
+    def duplicates(self):                       # Yields each group with 2 or more games
+        for groups in self.buckets.values():
+            for group in groups:
+                if len(group.paths) > 1:
+                    yield group
+
+
+def find_duplicates(paths, workers = None, chunk_size = 64, errors = None):
+
+    # Returns a Deduper holding every game. Failed records are appended to errors, if given.
+
+    deduper = Deduper()
+    for record in run_batch(signature_task, paths, workers = workers, chunk_size = chunk_size):
+        if record["ok"]:
+            deduper.add(record)
+        elif errors is not None:
+            errors.append(record)
+    return deduper
+
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description = "Find duplicate games (by moves) in a directory of game records.")
+    parser.add_argument("directory")
+    parser.add_argument("--workers", type = int, default = None)
+    parser.add_argument("--output", default = None, help = "output file (default stdout)")
+    args = parser.parse_args()
+
+    errors = []
+    deduper = find_duplicates(find_files(args.directory), workers = args.workers, errors = errors)
+
+    outfile = open(args.output, "w", encoding = "utf-8") if args.output else sys.stdout
+    groups = 0
+    try:
+        for group in deduper.duplicates():
+            groups += 1
+            outfile.write(json.dumps({"dyer": group.dyer, "moves": group.length, "exact": group.exact, "paths": sorted(group.paths)}, ensure_ascii = False) + "\n")
+    finally:
+        if outfile is not sys.stdout:
+            outfile.close()
+
+    print("{} games, {} duplicate groups, {} unreadable".format(deduper.games, groups, len(errors)), file = sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
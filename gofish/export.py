@@ -0,0 +1,202 @@
+# Exporting main lines as training data for move prediction: NumPy arrays of input planes and
+# next-move targets, written in fixed-size shards.
+#
+# Usage: python -m gofish.export <directory> <output directory> [--shard-size N] [--history N] [--format npy|npz] [--workers N]
+#
+# Requires NumPy. Each shard is a pair of .npy files (inputs and targets), which np.load() can
+# open with mmap_mode="r", or a single .npz if asked for. A manifest.json lists the shards.
+#
+# The inputs for a position have shape (planes, boardsize, boardsize), indexed [plane][y][x],
+# all from the point of view of the player to move:
+#
+#   0       own stones
+#   1       opponent stones
+#   2 - 4   own stones in groups with 1, 2, 3+ liberties
+#   5 - 7   opponent stones in groups with 1, 2, 3+ liberties
+#   8 ...   one plane per history move: where each of the last N moves was played (most recent first)
+#   last 2  all ones if black is to move; all ones everywhere (so zero padding shows where the edge is)
+#
+# The target is y * boardsize + x (0-based), or boardsize * boardsize for a pass.
+
+import argparse, functools, json, os, sys
+
+import numpy as np
+
+from gofish.batch import *
+from gofish.fastboard import *
+from gofish.loader import *
+
+DEFAULT_HISTORY = 4
+DEFAULT_SHARD_SIZE = 8192
+
+def plane_count(history):
+    return 8 + history + 2
+
+
+def position_planes(board, to_play, recent, history, out):
+
+    # Fill out (an array of zeros, shape (planes, boardsize, boardsize)) for the current position.
+    # recent is a list of the board indexes of previous moves, most recent last (0 for a pass).
+
+    width = board.width
+    opponent = BLACK if to_play == WHITE else WHITE
+    state = board.state
+    done = set()
+
+    for y in range(1, board.boardsize + 1):
+        for x in range(1, board.boardsize + 1):
+            i = y * width + x
+            colour = state[i]
+            if colour in (EMPTY, OFFBOARD) or i in done:
+                continue
+            stones, liberties = board.group(i)
+            done.update(stones)
+            base = 0 if colour == to_play else 1
+            plane = (2 if colour == to_play else 5) + min(liberties, 3) - 1
+            for p in stones:
+                py, px = p // width - 1, p % width - 1
+                out[base, py, px] = 1
+                out[plane, py, px] = 1
+
+    for n, i in enumerate(reversed(recent[-history:] if history else [])):      # recent[-0:] would be all of it
+        if i:
+            out[8 + n, i // width - 1, i % width - 1] = 1
+
+    if to_play == BLACK:
+        out[8 + history] = 1
+    out[8 + history + 1] = 1
+
+
+def export_task(path, boardsize = 19, history = DEFAULT_HISTORY):      # Runs in a worker process
+
+    root = load_sgf_mainline(path)
+    if root.boardsize != boardsize:
+        raise BadBoardSize
+
+    nodes = []
+    node = root
+    while node is not None:
+        nodes.append(node)
+        node = node.main_child()
+
+    board = FastBoard(boardsize)
+    recent = []
+    positions = []          # (node number, colour to move, move index, recent) for every node followed by a move
+
+    for n, node in enumerate(nodes):
+        board.update_from_node(node)
+        if node.move_colour() is not None:
+            coords = node.move_coords()
+            recent.append(board.index(*coords) if coords else 0)
+        if n + 1 < len(nodes):
+            colour = nodes[n + 1].move_colour()
+            if colour is not None:
+                coords = nodes[n + 1].move_coords()
+                target = (coords[1] - 1) * boardsize + (coords[0] - 1) if coords else boardsize * boardsize
+                inputs = np.zeros((plane_count(history), boardsize, boardsize), dtype = np.uint8)
+                position_planes(board, colour, recent, history, inputs)
+                positions.append((inputs, target))
+
+    if not positions:
+        return {"inputs": np.zeros((0, plane_count(history), boardsize, boardsize), dtype = np.uint8), "targets": np.zeros(0, dtype = np.int16)}
+
+    return {"inputs": np.stack([p[0] for p in positions]), "targets": np.array([p[1] for p in positions], dtype = np.int16)}
+
+
+class ShardWriter():
+
+    # Collects positions into preallocated arrays, writing each shard as soon as it fills,
+    # so memory use is one shard however large the export.
+
+    def __init__(self, directory, boardsize = 19, history = DEFAULT_HISTORY, shard_size = DEFAULT_SHARD_SIZE, fmt = "npy"):
+        self.directory = directory
+        self.boardsize = boardsize
+        self.history = history
+        self.shard_size = shard_size
+        self.fmt = fmt
+        self.inputs = np.zeros((shard_size, plane_count(history), boardsize, boardsize), dtype = np.uint8)
+        self.targets = np.zeros(shard_size, dtype = np.int16)
+        self.count = 0
+        self.shards = []
+        os.makedirs(directory, exist_ok = True)
+
+    def add(self, inputs, targets):
+        start = 0
+        while start < len(targets):
+            n = min(len(targets) - start, self.shard_size - self.count)
+            self.inputs[self.count:self.count + n] = inputs[start:start + n]
+            self.targets[self.count:self.count + n] = targets[start:start + n]
+            self.count += n
+            start += n
+            if self.count == self.shard_size:
+                self.flush()
+
+    def flush(self):
+        if self.count == 0:
+            return
+        name = "shard-{:05}".format(len(self.shards))
+        if self.fmt == "npz":
+            files = [name + ".npz"]
+            np.savez(os.path.join(self.directory, files[0]), inputs = self.inputs[:self.count], targets = self.targets[:self.count])
+        else:
+            files = [name + "-inputs.npy", name + "-targets.npy"]
+            np.save(os.path.join(self.directory, files[0]), self.inputs[:self.count])
+            np.save(os.path.join(self.directory, files[1]), self.targets[:self.count])
+        self.shards.append({"files": files, "positions": self.count})
+        self.count = 0
+
+    def close(self):
+        self.flush()
+        manifest = {
+            "boardsize": self.boardsize,
+            "history": self.history,
+            "planes": plane_count(self.history),
+            "positions": sum(shard["positions"] for shard in self.shards),
+            "shards": self.shards,
+        }
+        with open(os.path.join(self.directory, "manifest.json"), "w", encoding = "utf-8") as outfile:
+            json.dump(manifest, outfile, indent = 1)
+        return manifest
+
+
+def export(paths, directory, boardsize = 19, history = DEFAULT_HISTORY, shard_size = DEFAULT_SHARD_SIZE, fmt = "npy",
+           workers = None, chunk_size = 8, errors = None):
+
+    # Returns the manifest. Failed records are appended to errors, if given.
+
+    writer = ShardWriter(directory, boardsize, history, shard_size, fmt)
+    task = functools.partial(export_task, boardsize = boardsize, history = history)
+
+    for record in run_batch(task, paths, workers = workers, chunk_size = chunk_size):
+        if record["ok"]:
+            writer.add(record["inputs"], record["targets"])
+        elif errors is not None:
+            errors.append(record)
+
+    return writer.close()
+
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description = "Export main line positions from game records as NumPy training shards.")
+    parser.add_argument("directory")
+    parser.add_argument("output")
+    parser.add_argument("--boardsize", type = int, default = 19)
+    parser.add_argument("--history", type = int, default = DEFAULT_HISTORY)
+    parser.add_argument("--shard-size", type = int, default = DEFAULT_SHARD_SIZE)
+    parser.add_argument("--format", choices = ["npy", "npz"], default = "npy")
+    parser.add_argument("--workers", type = int, default = None)
+    args = parser.parse_args()
+
+    if args.history < 0:
+        parser.error("--history can't be negative")
+
+    errors = []
+    manifest = export(find_files(args.directory), args.output, args.boardsize, args.history, args.shard_size, args.format,
+                      workers = args.workers, errors = errors)
+
+    print("{} positions in {} shards, {} files skipped".format(manifest["positions"], len(manifest["shards"]), len(errors)), file = sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# A board for replaying many moves quickly: a flat bytearray with a border of OFFBOARD
+# points (so neighbours never need bounds checks), an incrementally updated Zobrist hash,
+# simple ko tracking, legality checks, and undo.
+#
+# Unlike Board, points are addressed internally by index = y * (boardsize + 2) + x.
+
+import operator, random
+
+from gofish.constants import *
+from gofish.symmetry import *
+from gofish.tree import *
+from gofish.utils import *
+
+OFFBOARD = 3
+
+zobrist_tables = dict()
+
+def zobrist_table(boardsize):       # [colour][index] ---> 63 bit key (so it fits in an SQLite INTEGER), same in every process
+    try:
+        return zobrist_tables[boardsize]
+    except KeyError:
+        pass
+    rng = random.Random(boardsize)
+    width = boardsize + 2
+    table = [[0] * (width * width)]
+    for colour in [BLACK, WHITE]:
+        table.append([rng.getrandbits(63) for i in range(width * width)])
+    zobrist_tables[boardsize] = table
+    return table
+
+
+class FastBoard():
+
+    def __init__(self, boardsize, symmetric_hashes = False):
+
+        # With symmetric_hashes, the hash of each of the 8 transformed positions is kept up to
+        # date too (in self.hashes), so the canonical hash is always available.
+
+        if boardsize < 1 or boardsize > 25:
+            raise BadBoardSize
+
+        self.boardsize = boardsize
+        self.width = boardsize + 2
+        self.neighbours = (-1, 1, -self.width, self.width)
+
+        self.state = bytearray([OFFBOARD]) * (self.width * self.width)
+        for y in range(1, boardsize + 1):
+            for x in range(1, boardsize + 1):
+                self.state[y * self.width + x] = EMPTY
+
+        self.ko = 0                 # Index of the point that can't be played next, or 0
+        self.history = []           # Undo records, see set_point()
+
+        zobrist = zobrist_table(boardsize)
+
+        if symmetric_hashes:
+            self.hash_keys = []
+            for table in padded_symmetry_tables(boardsize):
+                self.hash_keys.append([[keys[table[i]] for i in range(len(table))] for keys in zobrist])
+        else:
+            self.hash_keys = [zobrist]
+
+        self.hashes = [0] * len(self.hash_keys)
+
+    @property
+    def hash(self):
+        return self.hashes[0]
+
+    def canonical_hash(self):       # Only meaningful with symmetric_hashes
+        return min(self.hashes)
+
+    def index(self, x, y):
+        return y * self.width + x
+
+    def point(self, index):
+        return index % self.width, index // self.width
+
+    def get(self, x, y):
+        return self.state[y * self.width + x]
+
+    def set_point(self, i, colour, changes):
+        old = self.state[i]
+        if old == colour:
+            return
+        changes.append((i, old))
+        self.state[i] = colour
+        hashes = self.hashes
+        for k, keys in enumerate(self.hash_keys):
+            hashes[k] ^= keys[old][i] ^ keys[colour][i]
+
+    def group(self, i):             # Returns (list of indexes in the group, number of liberties)
+        state = self.state
+        colour = state[i]
+        stones = [i]
+        seen = {i}
+        liberties = set()
+        n = 0
+        while n < len(stones):
+            p = stones[n]
+            n += 1
+            for d in self.neighbours:
+                q = p + d
+                c = state[q]
+                if c == colour:
+                    if q not in seen:
+                        seen.add(q)
+                        stones.append(q)
+                elif c == EMPTY:
+                    liberties.add(q)
+        return stones, len(liberties)
+
+    def play_move(self, colour, x, y):      # No legality checks, as per SGF standard (see is_legal())
+
+        assert(colour in [BLACK, WHITE])
+
+        if x < 1 or x > self.boardsize or y < 1 or y > self.boardsize:
+            raise OffBoard
+
+        i = y * self.width + x
+        state = self.state
+        opponent = BLACK if colour == WHITE else WHITE
+        changes = []
+        self.history.append((changes, self.ko))
+
+        self.set_point(i, colour, changes)
+
+        captures = 0
+        captured_at = 0
+
+        for d in self.neighbours:
+            q = i + d
+            if state[q] == opponent:
+                stones, liberties = self.group(q)
+                if liberties == 0:
+                    for p in stones:
+                        self.set_point(p, EMPTY, changes)
+                    captures += len(stones)
+                    captured_at = q
+
+        stones, liberties = self.group(i)
+
+        if liberties == 0:          # Suicide
+            for p in stones:
+                self.set_point(p, EMPTY, changes)
+            self.ko = 0
+        elif captures == 1 and len(stones) == 1 and liberties == 1:
+            self.ko = captured_at
+        else:
+            self.ko = 0
+
+        return captures
+
+    def play_pass(self):
+        self.history.append(([], self.ko))
+        self.ko = 0
+
+    def set_stone(self, colour, x, y):      # For AB / AW / AE; no captures
+        if x < 1 or x > self.boardsize or y < 1 or y > self.boardsize:
+            raise OffBoard
+        changes = []
+        self.history.append((changes, self.ko))
+        self.set_point(y * self.width + x, colour, changes)
+        self.ko = 0
+
+    def is_legal(self, colour, x, y):       # Not occupied, not a simple ko recapture, not suicide
+
+        if x < 1 or x > self.boardsize or y < 1 or y > self.boardsize:
+            return False
+
+        i = y * self.width + x
+        if self.state[i] != EMPTY or i == self.ko:
+            return False
+
+        for d in self.neighbours:
+            if self.state[i + d] == EMPTY:
+                return True
+
+        mark = len(self.history)
+        self.play_move(colour, x, y)
+        legal = self.state[i] == colour
+        self.undo_to(mark)
+        return legal
+
+    def undo(self):
+        changes, self.ko = self.history.pop()
+        hashes = self.hashes
+        for i, old in reversed(changes):
+            current = self.state[i]
+            self.state[i] = old
+            for k, keys in enumerate(self.hash_keys):
+                hashes[k] ^= keys[current][i] ^ keys[old][i]
+
+    def mark(self):                 # Something to pass to undo_to() later
+        return len(self.history)
+
+    def undo_to(self, mark):
+        while len(self.history) > mark:
+            self.undo()
+
+    def update_from_node(self, node):       # Same rules as Board.update_from_node()
+
+        adders = {"AB": BLACK, "AW": WHITE, "AE": EMPTY}
+
+        for adder in adders:
+            if adder in node.properties:
+                for value in node.properties[adder]:
+                    for point in points_from_points_string(value, self.boardsize):
+                        self.set_stone(adders[adder], point[0], point[1])
+
+        movers = {"B": BLACK, "W": WHITE}
+
+        for mover in movers:
+            if mover in node.properties:
+                movestring = node.properties[mover][0]
+                try:
+                    x = ord(movestring[0]) - 96
+                    y = ord(movestring[1]) - 96
+                    self.play_move(movers[mover], x, y)
+                except (IndexError, OffBoard):
+                    self.play_pass()
+
+    def play_code(self, code):              # Play a move from encode_move()
+        colour, x, y = decode_move(code)
+        if x == 0:
+            self.play_pass()
+        else:
+            self.play_move(colour, x, y)
+
+    def transformed(self, symmetry):        # Returns a new FastBoard (with no history), see symmetry.py
+        table = padded_symmetry_tables(self.boardsize)[inverse_symmetry(symmetry)]
+        result = FastBoard(self.boardsize, symmetric_hashes = len(self.hash_keys) > 1)
+        changes = []
+        for i, colour in enumerate(operator.itemgetter(*table)(self.state)):
+            if colour != result.state[i]:
+                result.set_point(i, colour, changes)
+        result.ko = padded_symmetry_tables(self.boardsize)[symmetry][self.ko] if self.ko else 0
+        return result
+
+    def to_board(self):
+        board = Board(self.boardsize)
+        for x in range(1, self.boardsize + 1):
+            for y in range(1, self.boardsize + 1):
+                board.state[x][y] = self.state[y * self.width + x]
+        return board
+
+    def dump(self, highlight = None):
+        self.to_board().dump(highlight)
+
+
+def fastboard_from_board(board, symmetric_hashes = False):     # Works for Board or FastBoard
+    fast = FastBoard(board.boardsize, symmetric_hashes)
+    changes = []
+    for x in range(1, board.boardsize + 1):
+        for y in range(1, board.boardsize + 1):
+            if isinstance(board, FastBoard):
+                colour = board.get(x, y)
+            else:
+                colour = board.state[x][y]
+            fast.set_point(y * fast.width + x, colour, changes)
+    return fast
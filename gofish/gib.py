@@ -44,7 +44,14 @@ def parse_player_name(raw):
     return name, rank
 
 
-def parse_gib(gib):
+def gib_header_end(gib):        # Return the index of the first move line, or -1 if there is none in the text
+    match = re.search(r"^[ \t]*STO", gib, re.MULTILINE)
+    if match is None:
+        return -1
+    return match.start()
+
+
+def parse_gib(gib, header_only = False):
 
     root = Node(parent = None)
     node = root
@@ -133,6 +140,9 @@ def parse_gib(gib):
 
         if line[0:3] == "STO":
 
+            if header_only:
+                break
+
             move = line.split()
 
             key = "B" if move[3] == "1" else "W"
@@ -155,7 +165,7 @@ def parse_gib(gib):
             node = Node(parent = node)
             node.set_value(key, value)
 
-    if len(root.children) == 0:     # We'll assume we failed in this case
+    if len(root.children) == 0 and not header_only:     # We'll assume we failed in this case
         raise ParserFail
 
     return root
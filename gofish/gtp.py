@@ -0,0 +1,252 @@
+# An asyncio client for GTP engines. Every command is sent with a numeric id, and each
+# response is matched back to its command by that id, so any number of coroutines can await
+# replies from one engine at once.
+#
+#     engine = Engine(["gnugo", "--mode", "gtp"])
+#     await engine.start()
+#     await engine.boardsize(19)
+#     await engine.play(BLACK, 16, 4)
+#     move = await engine.genmove(WHITE)        # (x, y), PASS or RESIGN
+#     await engine.close()
+#
+# A failure response ("? ...") raises GTPError, as does the engine exiting while commands
+# are outstanding.
+#
+# send_many() writes a whole batch of commands before reading any replies, so e.g. replaying
+# a 300 move game costs about one round trip rather than 300.
+#
+# Give a Tracer (see gtp_trace.py) to record every command and response with its latency.
+
+import asyncio, re, time
+
+from gofish.constants import *
+from gofish.utils import *
+
+PASS, RESIGN = "pass", "resign"
+
+colour_names = {BLACK: "black", WHITE: "white"}
+
+response_regex = re.compile(r"([=?])(\d*)\s?(.*)", re.DOTALL)
+
+class GTPError(Exception): pass
+
+
+def vertex_string(x, y, boardsize):         # 16, 4  --->  "Q16"; x = y = 0 (or None) is a pass
+    if not x or not y:
+        return PASS
+    return english_string_from_point(x, y, boardsize)
+
+
+def parse_vertex(s, boardsize):             # "Q16"  --->  (16, 4), or PASS or RESIGN; None if it's neither
+    s = s.strip().lower()
+    if s in [PASS, RESIGN]:
+        return s
+    return point_from_english_string(s, boardsize)
+
+
+def node_moves(node, boardsize):            # The (colour, x, y) plays that take an engine from the parent's position to this node's
+
+    # GTP has no setup commands, so AB and AW stones are played as moves; AE is ignored.
+    # A pass (including an off-board move such as tt) is x = y = 0.
+
+    moves = []
+    for key, colour in [("AB", BLACK), ("AW", WHITE)]:
+        for value in node.properties.get(key, []):
+            for x, y in sorted(points_from_points_string(value, boardsize)):
+                moves.append((colour, x, y))
+    for key, colour in [("B", BLACK), ("W", WHITE)]:
+        for movestring in node.properties.get(key, []):
+            x, y = 0, 0
+            if len(movestring) == 2:
+                x = ord(movestring[0]) - 96
+                y = ord(movestring[1]) - 96
+                if x < 1 or x > boardsize or y < 1 or y > boardsize:
+                    x, y = 0, 0
+            moves.append((colour, x, y))
+    return moves
+
+
+def colour_to_move(node):
+    last = node.last_colour_played()
+    return BLACK if last in [None, WHITE] else WHITE
+
+
+class Engine():
+
+    def __init__(self, args, verbose = False, tracer = None):
+        self.args = list(args)
+        self.verbose = verbose
+        self.tracer = tracer
+        self.started = dict()           # id ---> (command, time sent); only kept when tracing
+        self.size = 19                  # Only needed to translate coordinates; kept up to date by boardsize()
+        self.process = None
+        self.reader = None
+        self.next_id = 0
+        self.pending = dict()           # id ---> future; dicts keep insertion order, which is relied on below
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(*self.args, stdin = asyncio.subprocess.PIPE, stdout = asyncio.subprocess.PIPE)
+        self.reader = asyncio.ensure_future(self.read_responses())
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process else None
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.returncode is None and not self.reader.done()
+
+    def write_command(self, command):           # Returns a future for the response
+
+        if not self.running:
+            raise GTPError("engine is not running")
+
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self.next_id] = future
+
+        line = "{} {}\n".format(self.next_id, command.strip())
+        if self.verbose:
+            print(line, end="")
+        if self.tracer:
+            self.started[self.next_id] = (command.strip(), time.monotonic())
+            self.tracer.sent(self, self.next_id, command.strip())
+        self.process.stdin.write(line.encode("utf-8"))
+        return future
+
+    async def send(self, command):              # Returns the text of a success response, without the "=" and id
+        future = self.write_command(command)
+        await self.process.stdin.drain()
+        return await future
+
+    async def send_many(self, commands):        # Returns a list of responses; if any failed, raises the first GTPError once all are in
+        futures = [self.write_command(command) for command in commands]
+        await self.process.stdin.drain()
+        results = await asyncio.gather(*futures, return_exceptions = True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    async def read_responses(self):
+
+        # Runs as a task for the life of the engine. A response is one or more lines ended by
+        # an empty line. Engines that don't echo ids are answered in order, which GTP requires.
+
+        lines = []
+        try:
+            while 1:
+                line = await self.process.stdout.readline()
+                if not line:
+                    break
+                line = line.decode("utf-8", errors="replace").replace("\r", "").replace("\t", " ")
+                if line.strip() == "":
+                    if lines:
+                        self.dispatch("".join(lines).strip())
+                        lines = []
+                    continue
+                if line[0] == "#" and not lines:        # Comment lines are allowed between responses
+                    continue
+                lines.append(line)
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(GTPError("engine exited"))
+            if self.tracer and self.pending:
+                self.tracer.lost(self, len(self.pending))
+            self.pending.clear()
+            self.started.clear()
+
+    def dispatch(self, response):
+
+        if self.verbose:
+            print(response + "\n")
+
+        match = response_regex.fullmatch(response)
+        if match is None or not self.pending:
+            return                                  # Junk, or a reply nobody is waiting for
+
+        status, id_string, text = match.groups()
+
+        command_id = int(id_string) if id_string and int(id_string) in self.pending else next(iter(self.pending))
+        future = self.pending.pop(command_id)
+
+        if self.tracer:
+            command, sent_at = self.started.pop(command_id)
+            self.tracer.received(self, command_id, command, text.strip(), status == "=", time.monotonic() - sent_at)
+
+        if future.done():                           # e.g. the awaiting task was cancelled
+            return
+        if status == "=":
+            future.set_result(text.strip())
+        else:
+            future.set_exception(GTPError(text.strip()))
+
+    async def close(self, timeout = 5):
+        if self.running:
+            try:
+                await asyncio.wait_for(self.send("quit"), timeout)
+            except (GTPError, asyncio.TimeoutError, ConnectionError):
+                pass
+        if self.process is not None and self.process.returncode is None:
+            try:
+                await asyncio.wait_for(self.process.wait(), timeout)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        if self.reader is not None:
+            await self.reader
+
+    # Common commands...
+
+    async def boardsize(self, size):
+        await self.send("boardsize {}".format(size))
+        self.size = size
+
+    async def clear_board(self):
+        await self.send("clear_board")
+
+    async def komi(self, komi):
+        await self.send("komi {}".format(komi))
+
+    def play_command(self, colour, x, y):
+        return "play {} {}".format(colour_names[colour], vertex_string(x, y, self.size))
+
+    async def play(self, colour, x, y):         # x = y = 0 for a pass
+        await self.send(self.play_command(colour, x, y))
+
+    async def play_many(self, moves):           # moves is a sequence of (colour, x, y), sent as one batch
+        await self.send_many([self.play_command(colour, x, y) for colour, x, y in moves])
+
+    async def genmove(self, colour):            # Returns (x, y), PASS or RESIGN
+        response = await self.send("genmove {}".format(colour_names[colour]))
+        move = parse_vertex(response, self.size)
+        if move is None:
+            raise GTPError("unexpected genmove response '{}'".format(response))
+        return move
+
+    async def undo(self):
+        await self.send("undo")
+
+    async def fixed_handicap(self, handicap):   # Returns a list of (x, y)
+        response = await self.send("fixed_handicap {}".format(handicap))
+        return [parse_vertex(s, self.size) for s in response.split()]
+
+    async def new_game(self, size, komi = 0, handicap = 0):     # One batch; returns the handicap points, if any
+        commands = ["boardsize {}".format(size), "clear_board", "komi {}".format(komi)]
+        if handicap:
+            commands.append("fixed_handicap {}".format(handicap))
+        responses = await self.send_many(commands)
+        self.size = size
+        if handicap:
+            return [parse_vertex(s, size) for s in responses[-1].split()]
+        return []
+
+    async def final_score(self):
+        return await self.send("final_score")
+
+    async def name(self):
+        return await self.send("name")
+
+    async def version(self):
+        return await self.send("version")
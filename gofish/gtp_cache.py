@@ -0,0 +1,124 @@
+# A persistent cache of GTP responses, so that positions which come up again and again (the
+# opening, above all) are only ever sent to an engine once.
+#
+# Responses are keyed on the engine's identity (its name, version and command line), the
+# position (board size, FastBoard hash and ko point, the side to move, and komi), and the
+# command. The cache is an SQLite file, trimmed to max_entries by evicting the least recently
+# used.
+#
+#     cache = ResponseCache("cache.db")
+#     identity = await engine_identity(engine)
+#     key = position_key(board, WHITE, 6.5)
+#     response = cache.get(identity, key, "genmove white")
+#     if response is None:
+#         response = await engine.send("genmove white")
+#         cache.put(identity, key, "genmove white", response)
+
+import sqlite3, time
+
+from gofish.gtp import *
+
+DEFAULT_DB = "gofish_gtp_cache.db"
+DEFAULT_MAX_ENTRIES = 1000000
+COMMIT_EVERY = 256
+
+schema = """
+CREATE TABLE IF NOT EXISTS responses (
+    engine      TEXT NOT NULL,
+    boardsize   INTEGER NOT NULL,
+    hash        INTEGER NOT NULL,
+    ko          INTEGER NOT NULL,
+    to_move     INTEGER NOT NULL,
+    komi        TEXT NOT NULL,
+    command     TEXT NOT NULL,
+    response    TEXT NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0,
+    last_used   REAL NOT NULL,
+    PRIMARY KEY (engine, boardsize, hash, ko, to_move, komi, command)
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name        TEXT PRIMARY KEY,
+    value       INTEGER NOT NULL
+);
+"""
+
+async def engine_identity(engine):      # A string naming the engine, for cache keys
+    parts = []
+    for command in ["name", "version"]:
+        try:
+            parts.append(await engine.send(command))
+        except GTPError:
+            parts.append("")
+    return " / ".join(parts + [" ".join(engine.args)])
+
+
+def position_key(board, colour, komi):  # board is a FastBoard; colour is the side to move
+    return (board.boardsize, board.hash, board.ko, colour, "{:g}".format(float(komi)))      # Every empty board hashes to 0, whatever its size
+
+
+class ResponseCache():
+
+    def __init__(self, db_filename = DEFAULT_DB, max_entries = DEFAULT_MAX_ENTRIES):
+        self.conn = sqlite3.connect(db_filename)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(responses)")]
+        if columns and "boardsize" not in columns:      # A cache from before the key had the board size; start again
+            self.conn.execute("DROP TABLE responses")
+        self.conn.executescript(schema)
+        self.max_entries = max_entries
+        self.entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        self.hits = 0                   # This session only; see totals() for all time
+        self.misses = 0
+        self.counted = (0, 0)           # How much of the above is already in the counters table
+        self.uncommitted = 0
+
+    def get(self, engine, key, command):        # Returns the cached response, or None
+        row = self.conn.execute("SELECT rowid, response FROM responses WHERE engine = ? AND boardsize = ? AND hash = ? AND ko = ? AND to_move = ? AND komi = ? AND command = ?",
+                                (engine,) + key + (command,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("UPDATE responses SET hits = hits + 1, last_used = ? WHERE rowid = ?", (time.time(), row[0]))
+        self.wrote()
+        return row[1]
+
+    def put(self, engine, key, command, response):
+        self.conn.execute("INSERT OR REPLACE INTO responses (engine, boardsize, hash, ko, to_move, komi, command, response, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                          (engine,) + key + (command, response, time.time()))
+        self.entries += 1               # Possibly an overcount, if the row was replaced, but that's fixed below
+        if self.entries > self.max_entries:
+            self.entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if self.entries > self.max_entries:
+                self.evict(self.entries - self.max_entries)
+        self.wrote()
+
+    def evict(self, count):             # Remove the count least recently used responses
+        self.conn.execute("DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY last_used LIMIT ?)", (count,))
+        self.entries -= count
+
+    def wrote(self):
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        for name, value, counted in [("hits", self.hits, self.counted[0]), ("misses", self.misses, self.counted[1])]:
+            self.conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)", (name,))
+            self.conn.execute("UPDATE counters SET value = value + ? WHERE name = ?", (value - counted, name))
+        self.counted = (self.hits, self.misses)
+        self.conn.commit()
+        self.uncommitted = 0
+
+    def hit_rate(self):                 # This session
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def totals(self):                   # (hits, misses) over the cache's whole life, including this session
+        self.commit()
+        counters = dict(self.conn.execute("SELECT name, value FROM counters"))
+        return counters.get("hits", 0), counters.get("misses", 0)
+
+    def close(self):
+        self.commit()
+        self.conn.close()
@@ -0,0 +1,268 @@
+# A small, deterministic GTP engine on FastBoard, for testing and load-testing GTP tooling
+# without a third party engine. It speaks GTP on stdin / stdout.
+#
+# Usage: python -m gofish.gtp_engine [--policy random|heuristic] [--seed N]
+#
+# Moves are checked with FastBoard.is_legal() (occupied points, simple ko, suicide), one
+# candidate at a time, so choosing a move rarely looks at more than a few points. The random
+# policy plays any legal move that doesn't fill one of its own eyes, and passes when there is
+# none. The heuristic policy first captures, then rescues its own groups from atari, and
+# avoids self-atari where it can. Everything depends only on the seed (0 unless --seed is
+# given) and the commands, so runs are repeatable.
+
+import argparse, contextlib, io, random, sys
+
+from gofish.constants import *
+from gofish.fastboard import *
+from gofish.gtp import PASS, vertex_string
+from gofish.tree import area_score, result_string
+from gofish.utils import *
+
+NAME = "gofish"
+VERSION = "1"
+DEFAULT_SEED = 0
+
+colour_lookup = {"b": BLACK, "black": BLACK, "w": WHITE, "white": WHITE}
+
+class GTPFailure(Exception): pass               # The message becomes the "?" response
+
+
+class GTPEngine():
+
+    def __init__(self, policy = "random", seed = DEFAULT_SEED):
+        self.policy = policy
+        self.rng = random.Random(seed)
+        self.komi = 0.0
+        self.new_board(19)
+
+    def new_board(self, size):
+        self.board = FastBoard(size)
+        self.marks = []                         # board.mark() before each move, for undo
+
+    def commands(self):
+        return sorted(name[4:] for name in dir(self) if name.startswith("cmd_"))
+
+    def handle(self, line):                     # Returns the full response (without the blank line), or None if there's no command
+
+        parts = line.split()
+        command_id = ""
+        if parts and parts[0].isdigit():
+            command_id = parts.pop(0)
+        if not parts:
+            return None
+
+        handler = getattr(self, "cmd_" + parts[0].lower(), None)
+        if handler is None:
+            return "?{} unknown command".format(command_id)
+        try:
+            text = handler(parts[1:])
+        except GTPFailure as err:
+            return "?{} {}".format(command_id, err).rstrip()
+        return "={} {}".format(command_id, text or "").rstrip()
+
+    # Helpers...
+
+    def parse_colour(self, s):
+        try:
+            return colour_lookup[s.lower()]
+        except KeyError:
+            raise GTPFailure("invalid color")
+
+    def parse_vertex(self, s):                  # Returns (x, y); (0, 0) for a pass
+        if s.lower() == PASS:
+            return 0, 0
+        point = point_from_english_string(s, self.board.boardsize)
+        if point is None:
+            raise GTPFailure("invalid vertex")
+        return point
+
+    def play(self, colour, x, y):
+        self.marks.append(self.board.mark())
+        if x:
+            self.board.play_move(colour, x, y)
+        else:
+            self.board.play_pass()
+
+    def liberty_of(self, stones):               # For a group known to have 1 liberty
+        state = self.board.state
+        for p in stones:
+            for d in self.board.neighbours:
+                if state[p + d] == EMPTY:
+                    return p + d
+
+    def is_own_eye(self, colour, i):            # Every neighbour is our stone or off the board
+        state = self.board.state
+        return all(state[i + d] in (colour, OFFBOARD) for d in self.board.neighbours)
+
+    def liberties_after(self, colour, i):       # Liberties of the group formed by playing at i
+        board = self.board
+        mark = board.mark()
+        x, y = board.point(i)
+        board.play_move(colour, x, y)
+        __, liberties = board.group(i)
+        board.undo_to(mark)
+        return liberties
+
+    def choose_move(self, colour):              # Returns a board index, or 0 to pass
+
+        board = self.board
+        state = board.state
+        opponent = BLACK if colour == WHITE else WHITE
+
+        empties = [i for i in range(len(state)) if state[i] == EMPTY]
+        self.rng.shuffle(empties)
+
+        def legal(i):
+            x, y = board.point(i)
+            return board.is_legal(colour, x, y) and not self.is_own_eye(colour, i)
+
+        if self.policy == "heuristic":
+
+            captures, rescues = [], []
+            seen = set()
+
+            for i in range(len(state)):
+                if state[i] not in (BLACK, WHITE) or i in seen:
+                    continue
+                stones, liberties = board.group(i)
+                seen.update(stones)
+                if liberties != 1:
+                    continue
+                liberty = self.liberty_of(stones)
+                if state[i] == opponent:
+                    captures.append((len(stones), liberty))
+                else:
+                    rescues.append((len(stones), liberty))
+
+            for __, i in sorted(captures, reverse = True):      # Biggest capture first
+                if legal(i):
+                    return i
+            for __, i in sorted(rescues, reverse = True):
+                if legal(i) and self.liberties_after(colour, i) > 1:
+                    return i
+
+            fallback = 0
+            for i in empties:
+                if legal(i):
+                    if self.liberties_after(colour, i) > 1:
+                        return i
+                    fallback = fallback or i
+            return fallback
+
+        for i in empties:
+            if legal(i):
+                return i
+        return 0
+
+    # GTP commands...
+
+    def cmd_protocol_version(self, args):
+        return "2"
+
+    def cmd_name(self, args):
+        return NAME
+
+    def cmd_version(self, args):
+        return VERSION
+
+    def cmd_known_command(self, args):
+        return "true" if args and args[0].lower() in self.commands() else "false"
+
+    def cmd_list_commands(self, args):
+        return "\n".join(self.commands())
+
+    def cmd_quit(self, args):
+        return ""
+
+    def cmd_boardsize(self, args):
+        try:
+            size = int(args[0])
+        except (IndexError, ValueError):
+            raise GTPFailure("boardsize not an integer")
+        if size < 1 or size > 25:
+            raise GTPFailure("unacceptable size")
+        self.new_board(size)
+
+    def cmd_clear_board(self, args):
+        self.new_board(self.board.boardsize)
+
+    def cmd_komi(self, args):
+        try:
+            self.komi = float(args[0])
+        except (IndexError, ValueError):
+            raise GTPFailure("komi not a float")
+
+    def cmd_play(self, args):
+        if len(args) < 2:
+            raise GTPFailure("syntax error")
+        colour = self.parse_colour(args[0])
+        x, y = self.parse_vertex(args[1])
+        if x and not self.board.is_legal(colour, x, y):
+            raise GTPFailure("illegal move")
+        self.play(colour, x, y)
+
+    def cmd_undo(self, args):
+        if not self.marks:
+            raise GTPFailure("cannot undo")
+        self.board.undo_to(self.marks.pop())
+
+    def cmd_genmove(self, args):
+        if not args:
+            raise GTPFailure("syntax error")
+        colour = self.parse_colour(args[0])
+        i = self.choose_move(colour)
+        x, y = self.board.point(i) if i else (0, 0)
+        self.play(colour, x, y)
+        return vertex_string(x, y, self.board.boardsize)
+
+    def cmd_fixed_handicap(self, args):
+        try:
+            handicap = int(args[0])
+        except (IndexError, ValueError):
+            raise GTPFailure("handicap not an integer")
+        points = sorted(handicap_points(self.board.boardsize, handicap))
+        if handicap < 2 or len(points) < handicap:
+            raise GTPFailure("invalid handicap")
+        if any(self.board.state[i] != EMPTY for i in range(len(self.board.state)) if self.board.state[i] != OFFBOARD):
+            raise GTPFailure("board not empty")
+        for x, y in points:
+            self.board.set_stone(BLACK, x, y)
+        self.marks = []                         # Handicap stones can't be undone
+        return " ".join(vertex_string(x, y, self.board.boardsize) for x, y in points)
+
+    def cmd_final_score(self, args):
+        return result_string(area_score(self.board.to_board(), self.komi))
+
+    def cmd_showboard(self, args):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.board.dump()
+        return "\n" + output.getvalue().rstrip("\n")
+
+
+def serve(engine, infile = sys.stdin, outfile = sys.stdout):
+    for line in infile:
+        line = line.split("#")[0].replace("\t", " ").strip()
+        if not line:
+            continue
+        response = engine.handle(line)
+        if response is None:
+            continue
+        outfile.write(response + "\n\n")
+        outfile.flush()
+        parts = line.split()
+        if parts[1 if parts[0].isdigit() else 0].lower() == "quit":
+            break
+
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description = "A simple GTP engine, playing random or lightly heuristic legal moves.")
+    parser.add_argument("--policy", choices = ["random", "heuristic"], default = "random")
+    parser.add_argument("--seed", type = int, default = DEFAULT_SEED, help = "change this for different games")
+    args = parser.parse_args()
+    serve(GTPEngine(policy = args.policy, seed = args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# A pool of identical GTP engines, for analysing many positions at once. Work is given as
+# jobs: coroutine functions taking an Engine (see gtp.py), which are handed to whichever
+# engine is idle from a bounded queue.
+#
+#     async def job(engine):
+#         await engine.new_game(19)
+#         await engine.play_many(moves)
+#         return await engine.genmove(BLACK)
+#
+#     async with EnginePool(["gnugo", "--mode", "gtp"], engines = 4) as pool:
+#         results = await pool.map([job1, job2, ...])
+#
+# Nothing is known about an engine's position when a job starts, so each job must set up
+# the position it needs. If the engine dies during a job, it is restarted and the job is
+# tried again (up to retries times) on the fresh engine.
+
+import asyncio, os
+
+from gofish.gtp import *
+
+class EnginePool():
+
+    def __init__(self, args, engines = None, max_pending = None, retries = 2, verbose = False, tracer = None):
+        self.args = list(args)
+        self.tracer = tracer            # Passed to every engine; also told the queue depth
+        self.engines = [None] * (engines or os.cpu_count() or 1)
+        self.max_pending = max_pending or 2 * len(self.engines)
+        self.retries = retries
+        self.verbose = verbose
+        self.queue = None
+        self.workers = []
+        self.restarts = 0
+        self.jobs_done = 0
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize = self.max_pending)
+        for n in range(len(self.engines)):
+            self.engines[n] = await self.new_engine()
+        self.workers = [asyncio.ensure_future(self.worker(n)) for n in range(len(self.engines))]
+
+    async def new_engine(self):
+        engine = Engine(self.args, verbose = self.verbose, tracer = self.tracer)
+        await engine.start()
+        return engine
+
+    async def restart(self, n):
+        await self.engines[n].close(timeout = 1)
+        self.engines[n] = await self.new_engine()
+        self.restarts += 1
+        if self.tracer:
+            self.tracer.gauge("restarts", self.restarts)
+
+    async def worker(self, n):
+        while 1:
+            job, future = await self.queue.get()
+            if self.tracer:
+                self.tracer.gauge("queue_depth", self.queue.qsize())
+            tries = 0
+            while not future.done():                        # Also done if the caller was cancelled
+                try:
+                    result = await job(self.engines[n])
+                except Exception as err:
+                    if not self.engines[n].running:         # The engine died: GTPError, or e.g. BrokenPipeError from a write
+                        tries += 1
+                        try:
+                            await self.restart(n)
+                        except Exception as restart_err:    # The next job will find the engine dead and try again
+                            err = restart_err
+                            tries = self.retries + 1
+                        if tries <= self.retries:
+                            continue
+                    if not future.done():                   # An ordinary failure response, a bug in the job, or out of retries
+                        future.set_exception(err)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+            self.jobs_done += 1
+            self.queue.task_done()
+
+    async def submit(self, job):        # Waits for room in the queue, then for the result
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((job, future))
+        if self.tracer:
+            self.tracer.gauge("queue_depth", self.queue.qsize())
+        return await future
+
+    async def map(self, jobs):          # Results in the order of the jobs; exceptions are returned, not raised
+        return await asyncio.gather(*[self.submit(job) for job in jobs], return_exceptions = True)
+
+    async def close(self):
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions = True)
+        await asyncio.gather(*[engine.close() for engine in self.engines if engine])
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
@@ -0,0 +1,88 @@
+# A stand-in GTP engine for testing GTP tooling offline. It keeps no board: genmove answers
+# a random point (not necessarily legal), and final_score is always "0". It can be made slow,
+# or made to crash now and then, to exercise clients and the engine pool.
+#
+# Usage: python -m gofish.gtp_stub [--delay SECONDS] [--crash CHANCE] [--seed N]
+
+import argparse, os, random, sys, time
+
+from gofish.gtp import vertex_string
+from gofish.utils import handicap_points
+
+commands = ["boardsize", "clear_board", "komi", "play", "undo", "genmove", "fixed_handicap", "final_score",
+            "name", "version", "protocol_version", "known_command", "list_commands", "quit"]
+
+def respond(command_id, ok, text = ""):
+    sys.stdout.write("{}{} {}\n\n".format("=" if ok else "?", command_id, text).replace(" \n", "\n"))
+    sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "A fake GTP engine that plays random points.")
+    parser.add_argument("--delay", type = float, default = 0, help = "seconds to think per genmove")
+    parser.add_argument("--crash", type = float, default = 0, help = "chance of exiting abruptly on each command")
+    parser.add_argument("--seed", type = int, default = None)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    size = 19
+
+    for line in sys.stdin:
+
+        parts = line.split("#")[0].split()
+        if not parts:
+            continue
+
+        command_id = ""
+        if parts[0].isdigit():
+            command_id = parts.pop(0)
+        if not parts:
+            continue
+
+        if args.crash and rng.random() < args.crash:
+            os._exit(1)
+
+        command, arguments = parts[0], parts[1:]
+
+        if command == "boardsize":
+            try:
+                size = int(arguments[0])
+            except (IndexError, ValueError):
+                respond(command_id, False, "syntax error")
+                continue
+            respond(command_id, True)
+        elif command == "genmove":
+            time.sleep(args.delay)
+            respond(command_id, True, vertex_string(rng.randint(1, size), rng.randint(1, size), size))
+        elif command == "fixed_handicap":
+            try:
+                points = sorted(handicap_points(size, int(arguments[0])))
+            except (IndexError, ValueError):
+                points = []
+            if len(points) < 2:
+                respond(command_id, False, "invalid handicap")
+                continue
+            respond(command_id, True, " ".join(vertex_string(x, y, size) for x, y in points))
+        elif command == "final_score":
+            respond(command_id, True, "0")
+        elif command == "name":
+            respond(command_id, True, "gofish stub")
+        elif command == "version":
+            respond(command_id, True, "1")
+        elif command == "protocol_version":
+            respond(command_id, True, "2")
+        elif command == "known_command":
+            respond(command_id, True, "true" if arguments and arguments[0] in commands else "false")
+        elif command == "list_commands":
+            respond(command_id, True, "\n".join(commands))
+        elif command == "quit":
+            respond(command_id, True)
+            break
+        elif command in commands:
+            respond(command_id, True)
+        else:
+            respond(command_id, False, "unknown command")
+
+
+if __name__ == "__main__":
+    main()
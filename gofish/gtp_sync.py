@@ -0,0 +1,116 @@
+# Keeping an engine's position in step with a node of a gofish tree, as cheaply as possible.
+#
+#     sync = EngineSync(engine)
+#     await sync.sync(node)             # The engine now has node's position
+#     await sync.sync(other_node)       # undo back to the common ancestor, then play down
+#
+# The path of nodes the engine has been given (root first) is remembered, so moving to a
+# nearby node costs a few undo and play commands, sent as one pipelined batch each. A full
+# replay (new_game and every move) is only needed for a different tree, or when the engine
+# rejects undo.
+
+from gofish.gtp import *
+
+class EngineSync():
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.full_replays = 0
+        self.reset()
+
+    def reset(self):                # Forget what the engine has, so the next sync() does a full replay
+        self.path = []              # Nodes, root first, whose moves the engine has been given
+        self.counts = []            # How many plays each of those nodes needed
+        self.positions = dict()     # id(node) ---> index in path
+
+    @property
+    def node(self):                 # The node whose position the engine has, or None
+        return self.path[-1] if self.path else None
+
+    def extend(self, node, boardsize):      # Returns the plays for the node, having added it to the path
+        moves = node_moves(node, boardsize)
+        self.positions[id(node)] = len(self.path)
+        self.path.append(node)
+        self.counts.append(len(moves))
+        return moves
+
+    def truncate(self, length):             # Returns the number of plays removed
+        for node in self.path[length:]:
+            del self.positions[id(node)]
+        removed = sum(self.counts[length:])
+        del self.path[length:]
+        del self.counts[length:]
+        return removed
+
+    async def sync(self, target):
+
+        # Walk up from the target until reaching a node the engine has had; everything
+        # below that on the current path is undone, then the new nodes are played.
+
+        new_nodes = []
+        node = target
+        while node is not None and id(node) not in self.positions:
+            new_nodes.append(node)
+            node = node.parent
+
+        if node is None:
+            await self.replay(target)
+            return
+
+        boardsize = self.path[0].boardsize
+        undos = self.truncate(self.positions[id(node)] + 1)
+
+        try:
+            if undos:
+                await self.engine.send_many(["undo"] * undos)
+        except GTPError:
+            await self.replay(target)
+            return
+
+        moves = []
+        for node in reversed(new_nodes):
+            moves += self.extend(node, boardsize)
+
+        try:
+            await self.engine.play_many(moves)
+        except GTPError:
+            self.reset()                    # Some of the plays may have happened
+            raise
+
+    async def replay(self, target):
+
+        self.reset()
+        self.full_replays += 1
+
+        path = target.node_path()
+        root = path[0]
+        boardsize = root.boardsize
+
+        try:
+            await self.engine.new_game(boardsize, root.get_value("KM") or 0)
+            moves = []
+            for node in path:
+                moves += self.extend(node, boardsize)
+            await self.engine.play_many(moves)
+        except GTPError:
+            self.reset()
+            raise
+
+    async def ask(self, command, undo = False):
+
+        # Send a command from the current position. With undo (needed after genmove, which
+        # plays the move it chooses, unless it resigns) the position is restored afterwards.
+        # If it's not clear whether a move was played, the next sync() does a full replay.
+
+        try:
+            response = await self.engine.send(command)
+        except BaseException:
+            if undo:
+                self.reset()
+            raise
+        if undo and response.strip().lower() != RESIGN:
+            try:
+                await self.engine.undo()
+            except GTPError:
+                self.reset()
+        return response
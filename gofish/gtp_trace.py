@@ -0,0 +1,117 @@
+# Structured tracing of GTP traffic, for tuning engines and comparing engine builds.
+#
+#     tracer = Tracer("trace.jsonl")
+#     engine = Engine(args, tracer = tracer)        # Any number of engines can share a tracer
+#     ...
+#     tracer.close()                                # Writes and prints the summary
+#
+# The transcript has one JSON object per line: every command sent and every response, with
+# a timestamp, the engine's process id, and (for responses) the latency. Latencies are also
+# kept as a histogram per command name (genmove, play, final_score...), and counters track
+# commands in flight and, when a pool reports it, the depth of its work queue.
+
+import bisect, json, sys, time
+
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000]       # Upper bounds; one more bucket holds the rest
+
+class Histogram():
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms, ok = True):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.errors += 0 if ok else 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p):            # The upper bound of the bucket holding the pth percentile (or the max, if lower), in ms
+        target = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target and n:
+                return round(min(BUCKETS_MS[i], self.max), 3) if i < len(BUCKETS_MS) else round(self.max, 3)
+        return 0.0
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max, 3),
+            "buckets": {("<={}".format(bound) if i < len(BUCKETS_MS) else ">{}".format(BUCKETS_MS[-1])): n
+                        for i, (bound, n) in enumerate(zip(BUCKETS_MS + [None], self.counts)) if n},
+        }
+
+
+class Tracer():
+
+    def __init__(self, filename = None):            # Without a filename, only the summary is kept
+        self.outfile = open(filename, "w", encoding = "utf-8") if filename else None
+        self.start = time.time()
+        self.histograms = dict()        # command name ---> Histogram
+        self.counters = dict()          # name ---> [current, peak]
+        self.in_flight = 0
+
+    def write(self, record):
+        if self.outfile:
+            record["t"] = round(time.time(), 6)
+            self.outfile.write(json.dumps(record) + "\n")
+
+    def gauge(self, name, value):
+        counter = self.counters.setdefault(name, [0, 0])
+        counter[0] = value
+        counter[1] = max(counter[1], value)
+
+    def sent(self, engine, command_id, command):
+        self.in_flight += 1
+        self.gauge("in_flight", self.in_flight)
+        self.write({"engine": engine.pid, "id": command_id, "send": command})
+
+    def received(self, engine, command_id, command, response, ok, seconds):
+        self.in_flight -= 1
+        self.gauge("in_flight", self.in_flight)
+        ms = seconds * 1000
+        name = command.split()[0] if command.split() else ""
+        self.histograms.setdefault(name, Histogram()).add(ms, ok)
+        self.write({"engine": engine.pid, "id": command_id, "ok": ok, "response": response, "ms": round(ms, 3)})
+
+    def lost(self, engine, count):              # Commands that never got a response (the engine exited)
+        self.in_flight -= count
+        self.gauge("in_flight", self.in_flight)
+        self.write({"engine": engine.pid, "exited": True, "unanswered": count})
+
+    def summary(self):
+        return {
+            "seconds": round(time.time() - self.start, 3),
+            "commands": {name: histogram.as_dict() for name, histogram in sorted(self.histograms.items())},
+            "counters": {name: {"current": c[0], "peak": c[1]} for name, c in sorted(self.counters.items())},
+        }
+
+    def close(self, report = sys.stderr):       # Writes the summary to the transcript, and prints it to report (if not None)
+        summary = self.summary()
+        self.write({"summary": summary})
+        if self.outfile:
+            self.outfile.close()
+            self.outfile = None
+        if report:
+            print_summary(summary, report)
+        return summary
+
+
+def print_summary(summary, outfile = sys.stderr):
+    print("GTP trace, {:.1f} s:".format(summary["seconds"]), file = outfile)
+    for name, h in summary["commands"].items():
+        print("  {:<16} {:>7} sent  {:>5} failed  mean {:>9.2f} ms  p50 {:>6g}  p90 {:>6g}  p99 {:>6g}  max {:>9.2f} ms".format(
+              name, h["count"], h["errors"], h["mean_ms"], h["p50_ms"], h["p90_ms"], h["p99_ms"], h["max_ms"]), file = outfile)
+    for name, c in summary["counters"].items():
+        print("  {:<16} peak {}".format(name, c["peak"]), file = outfile)
@@ -1,64 +1,163 @@
 # Internally, everything is stored as SGF (or rather a tree-structure that incorporates properties like SGF's).
 # See tree.py for the implementation.
 
+import codecs, re
+
+from gofish.bintree import *
+from gofish.compress import *
 from gofish.gib import *
 from gofish.ngf import *
 from gofish.sgf import *
 from gofish.ugf import *
 
-def load(filename):
+# The format and the encoding are both decided from the file's bytes, read once. The
+# extension is only consulted when the content is inconclusive.
 
-    with open(filename, encoding="utf8", errors="replace") as infile:
-        contents = infile.read()
+SGF, GIB, NGF, UGF = "sgf", "gib", "ngf", "ugf"
 
-    # FileNotFoundError is just allowed to bubble up
+SNIFF_BYTES = 4096
 
-    try:
-        root = parse_sgf(contents)
+formats = {
+    # format    parser          header_end          default encoding
+    SGF:        (parse_sgf,     sgf_header_end,     "utf8"),
+    GIB:        (parse_gib,     gib_header_end,     "utf8"),            # These can be in various different encodings, I think
+    NGF:        (parse_ngf,     ngf_header_end,     "gb18030"),
+    UGF:        (parse_ugf,     ugf_header_end,     "shift_jisx0213"),
+}
+
+format_extensions = {".sgf": SGF, ".gib": GIB, ".ngf": NGF, ".ugf": UGF, ".ugi": UGF}
+
+boms = [                                    # Longest first, since the UTF-32-LE BOM starts with the UTF-16-LE one
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+ca_regex = re.compile(rb"CA\s*\[([^\]]*)\]")
+
+def detect_format(head, filename = ""):     # head is the decoded start of the file
+
+    stripped = head.lstrip()
 
-    except ParserFail:      # All the parsers below can themselves raise ParserFail
+    if stripped.startswith("("):
+        return SGF
+    if "\\[GAMEBLACKNAME=" in head or stripped.startswith("\\[HEADER\\]"):
+        return GIB
+    if stripped[:8].upper() == "[HEADER]":
+        return UGF
 
-        if filename[-4:].lower() == ".gib":
-            print("Parsing as SGF failed, trying to parse as GIB")
+    # NGF has no signature, but a fixed layout: the 2nd line is the board size and the 6th the handicap...
 
-            # These can be in variousdifferent encodings, I think,
-            # so no attempt to switch to GBK or whatever...
+    lines = stripped.split("\n", 8)
+    if len(lines) > 7 and lines[1].strip().isdigit() and lines[5].strip().isdigit():
+        return NGF
 
-            root = parse_gib(contents)
+    if re.search(r"\(\s*;", head):
+        return SGF
 
-        elif filename[-4:].lower() == ".ngf":
-            print("Parsing as SGF failed, trying to parse as NGF")
+    return format_extensions.get(strip_compression_extension(filename)[-4:].lower(), SGF)
 
-            # These seem to use GB18030:
 
-            with open(filename, encoding="gb18030", errors="replace") as infile:
-                contents = infile.read()
+def detect_encoding(raw, fmt):              # raw is the start of the file, as bytes
 
-            root = parse_ngf(contents)
+    for bom, encoding in boms:
+        if raw.startswith(bom):
+            return encoding
 
-        elif filename[-4:].lower() in [".ugf", ".ugi"]:
-            print("Parsing as SGF failed, trying to parse as UGF")
+    if fmt == SGF:
+        match = ca_regex.search(raw)
+        if match:
+            try:
+                return codecs.lookup(match.group(1).strip().decode("ascii")).name
+            except (LookupError, UnicodeDecodeError):
+                pass
 
-            # These seem to usually be in Shift-JIS encoding, hence:
+    return formats[fmt][2]
 
-            with open(filename, encoding="shift_jisx0213", errors="replace") as infile:
-                contents = infile.read()
 
-            root = parse_ugf(contents)
+def detect(raw, filename = ""):             # Returns (format, encoding)
+    for bom, encoding in boms:
+        if raw.startswith(bom):
+            head = raw[:SNIFF_BYTES].decode(encoding, errors="replace")
+            break
+    else:
+        head = raw[:SNIFF_BYTES].decode("latin-1")      # Every signature is ASCII, and latin-1 never fails
+    fmt = detect_format(head, filename)
+    return fmt, detect_encoding(raw[:SNIFF_BYTES], fmt)
+
+
+def read_source(filename):                  # Returns (contents, format). Any gzip, bz2 or xz compression is undone while reading
+
+    with open_binary(filename) as infile:
+        raw = infile.read()
+
+    # FileNotFoundError is just allowed to bubble up
+
+    fmt, encoding = detect(raw, filename)
+    return raw.decode(encoding, errors="replace"), fmt
 
-        else:
-            raise
+
+def load(filename, use_cache = False):      # use_cache keeps a binary copy of the tree beside the file, see bintree.py
+
+    if use_cache:
+        root = load_cache(filename)
+        if root is not None:
+            return root
+
+    contents, fmt = read_source(filename)
+
+    root = formats[fmt][0](contents)        # All the parsers can raise ParserFail
 
     cleanup(root)
+
+    if use_cache:
+        save_cache(filename, root)
+
     return root
 
 
-def load_sgf_mainline(filename):
+def load_sgf_mainline(filename):            # The other formats have no variations, so they are simply loaded
+
+    contents, fmt = read_source(filename)
 
-    with open(filename, encoding="utf8", errors="replace") as infile:
-        contents = infile.read()
+    if fmt == SGF:
+        root = parse_sgf(contents, main_line_only = True)
+    else:
+        root = formats[fmt][0](contents)
+
+    cleanup(root)
+    return root
 
-    root = parse_sgf(contents, main_line_only = True)
+
+# Header-only loading reads the file in growing chunks and stops as soon as the header
+# section (the SGF root node, or everything before the first move in the other formats)
+# is known to be complete. Nothing past that point is read from disk or parsed.
+
+def load_header(filename):
+
+    with open_binary(filename) as infile:
+        raw = infile.read(SNIFF_BYTES)
+        fmt, encoding = detect(raw, filename)
+        parser, header_end, __ = formats[fmt]
+        chunk_size = SNIFF_BYTES
+        while 1:
+            contents = raw.decode(encoding, errors="replace")
+            end = header_end(contents)
+            if end != -1:
+                contents = contents[:end]
+                break
+            chunk = infile.read(chunk_size)
+            if not chunk:
+                break
+            raw += chunk
+            chunk_size *= 2
+
+    if fmt == SGF:
+        root = parse_sgf(contents)
+    else:
+        root = parser(contents, header_only = True)
 
     cleanup(root)
     return root
@@ -0,0 +1,175 @@
+# Headless engine versus engine matches.
+#
+# Usage: python -m gofish.match --engine1 "gnugo --mode gtp" --engine2 "other --gtp" [--games N]
+#                               [--size 19] [--komi 7.5] [--handicap 0] [--concurrency K]
+#                               [--max-moves M] [--output DIR] [--trace FILE]
+#
+# The engines take black alternately, starting with engine 1. Every game gets its own pair
+# of engine processes, and up to --concurrency games run at once. Moves are checked with
+# Node.make_move(), so an illegal move loses the game, as does resigning. After two passes
+# in a row (or --max-moves moves) the game is scored by area, with komi. Each game is saved
+# as SGF in --output, and the match result is reported with the Elo difference it implies.
+# --trace records all GTP traffic, see gtp_trace.py.
+
+import argparse, asyncio, datetime, math, os, shlex, sys, time
+
+import gofish
+from gofish.gtp import *
+from gofish.gtp_trace import *
+from gofish.tree import area_score, result_string
+
+def elo_difference(score):          # Elo difference implied by a score fraction (wins + draws / 2) / games
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return 400 * math.log10(score / (1 - score))
+
+
+async def play_game(black_args, white_args, size, komi, handicap, max_moves, tracer = None):
+
+    # Returns (root, winner, moves); winner is BLACK, WHITE or None for a draw. Engine failures
+    # (other than illegal moves) raise GTPError.
+
+    engines = {BLACK: Engine(black_args, tracer = tracer), WHITE: Engine(white_args, tracer = tracer)}
+
+    try:
+        for engine in engines.values():
+            await engine.start()
+
+        root = gofish.new_tree(size)
+        root.set_value("KM", komi)
+        root.set_value("DT", datetime.date.today().isoformat())
+        for colour, key in [(BLACK, "PB"), (WHITE, "PW")]:
+            try:
+                root.set_value(key, await engines[colour].name())
+            except GTPError:
+                root.set_value(key, " ".join(engines[colour].args))
+
+        points = await engines[BLACK].new_game(size, komi, handicap)
+        await engines[WHITE].new_game(size, komi, handicap)
+        if handicap:
+            root.set_value("HA", handicap)
+            for point in points:
+                root.add_stone(BLACK, point[0], point[1])
+
+        node = root
+        colour = WHITE if handicap else BLACK
+        passes = 0
+        moves = 0
+        result = None
+
+        while result is None:
+
+            opponent = BLACK if colour == WHITE else WHITE
+            move = await engines[colour].genmove(colour)
+
+            if move == RESIGN:
+                result = "{}+R".format("B" if opponent == BLACK else "W")
+                winner = opponent
+                break
+
+            if move == PASS:
+                node = node.make_pass(colour)
+                passes += 1
+                await engines[opponent].play(colour, 0, 0)
+            else:
+                try:
+                    node = node.make_move(move[0], move[1], colour)
+                except gofish.IllegalMove:
+                    result = "{}+F".format("B" if opponent == BLACK else "W")
+                    winner = opponent
+                    node.add_to_comment_bottom("{} played the illegal move {}".format(colour_names[colour], vertex_string(move[0], move[1], size)))
+                    break
+                passes = 0
+                await engines[opponent].play(colour, move[0], move[1])
+
+            moves += 1
+
+            if passes >= 2 or moves >= max_moves:
+                score = area_score(node.board, float(komi))
+                result = result_string(score)
+                winner = BLACK if score > 0 else WHITE if score < 0 else None
+
+            colour = opponent
+
+        root.set_value("RE", result)
+        return root, winner, moves
+
+    finally:
+        await asyncio.gather(*[engine.close() for engine in engines.values()])
+
+
+async def run_match(engine1_args, engine2_args, games = 2, size = 19, komi = 7.5, handicap = 0, concurrency = 2, max_moves = 1000, output_dir = None, tracer = None):
+
+    # Returns a dict of results. Game n (from 0) has engine 1 as black when n is even.
+
+    semaphore = asyncio.Semaphore(concurrency)
+    record = {"engine1": 0, "engine2": 0, "draws": 0, "errors": 0, "moves": 0}
+
+    async def game(n):
+        engine1_black = n % 2 == 0
+        black, white = (engine1_args, engine2_args) if engine1_black else (engine2_args, engine1_args)
+        async with semaphore:
+            try:
+                root, winner, moves = await play_game(black, white, size, komi, handicap, max_moves, tracer)
+            except (GTPError, ConnectionError) as err:
+                print("game {}: {}".format(n, err), file = sys.stderr)
+                record["errors"] += 1
+                return
+        record["moves"] += moves
+        if winner is None:
+            record["draws"] += 1
+        elif (winner == BLACK) == engine1_black:
+            record["engine1"] += 1
+        else:
+            record["engine2"] += 1
+        print("game {}: {} ({} moves)".format(n, root.get_value("RE"), moves), file = sys.stderr)
+        if output_dir:
+            gofish.save_file(os.path.join(output_dir, "game_{:04d}.sgf".format(n)), root)
+
+    start = time.monotonic()
+    await asyncio.gather(*[game(n) for n in range(games)])
+    record["seconds"] = time.monotonic() - start
+
+    played = record["engine1"] + record["engine2"] + record["draws"]
+    record["score"] = (record["engine1"] + record["draws"] / 2) / played if played else 0.5
+    record["elo"] = elo_difference(record["score"])
+    record["moves_per_second"] = record["moves"] / record["seconds"] if record["seconds"] else 0.0
+    return record
+
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description = "Play matches between two GTP engines.")
+    parser.add_argument("--engine1", required = True, help = "the first engine's command line, as one string")
+    parser.add_argument("--engine2", required = True, help = "the second engine's command line, as one string")
+    parser.add_argument("--games", type = int, default = 2)
+    parser.add_argument("--size", type = int, default = 19)
+    parser.add_argument("--komi", type = float, default = 7.5)
+    parser.add_argument("--handicap", type = int, default = 0)
+    parser.add_argument("--concurrency", type = int, default = os.cpu_count() or 1, help = "games at once (each uses 2 engine processes)")
+    parser.add_argument("--max-moves", type = int, default = 1000, help = "score the game after this many moves")
+    parser.add_argument("--output", default = None, metavar = "DIR", help = "save each game here as SGF")
+    parser.add_argument("--trace", default = None, metavar = "FILE", help = "write a JSONL transcript of the GTP traffic")
+    args = parser.parse_args()
+
+    tracer = Tracer(args.trace) if args.trace else None
+
+    if args.output:
+        os.makedirs(args.output, exist_ok = True)
+
+    record = asyncio.run(run_match(shlex.split(args.engine1), shlex.split(args.engine2), games = args.games, size = args.size,
+                                   komi = args.komi, handicap = args.handicap, concurrency = args.concurrency,
+                                   max_moves = args.max_moves, output_dir = args.output, tracer = tracer))
+
+    print("engine 1: {} wins, engine 2: {} wins, {} draws, {} errors".format(record["engine1"], record["engine2"], record["draws"], record["errors"]))
+    print("engine 1 score {:.1%}, Elo difference {:+.0f}".format(record["score"], round(record["elo"], 0) + 0.0))    # + 0.0 so e.g. -0.3 prints +0, not -0
+    print("{} moves in {:.1f} s, {:.1f} moves/s".format(record["moves"], record["seconds"], record["moves_per_second"]))
+
+    if tracer:
+        tracer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,19 @@ from gofish.constants import *
 from gofish.tree import *
 from gofish.utils import *
 
-def parse_ngf(ngf):
+NGF_HEADER_LINES = 11
+
+def ngf_header_end(ngf):        # Return the index just past the header lines, or -1 if the text ends first
+    i = len(ngf) - len(ngf.lstrip())
+    for n in range(NGF_HEADER_LINES):
+        i = ngf.find("\n", i)
+        if i == -1:
+            return -1
+        i += 1
+    return i
+
+
+def parse_ngf(ngf, header_only = False):
 
     ngf = ngf.strip()
     lines = ngf.split("\n")
@@ -73,6 +85,9 @@ def parse_ngf(ngf):
     if re:
         root.set_value("RE", re)
 
+    if header_only:
+        return root
+
     # Main parser...
 
     for line in lines:
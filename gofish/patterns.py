@@ -0,0 +1,312 @@
+# An index of local patterns: the contents of fixed windows of the board (the 4 corners, or
+# a square centred on each move) at every main line position of a collection, normalised
+# under the board symmetries and colour swap, together with the move that was played next.
+#
+# Usage: python -m gofish.patterns index <directory> [--db FILE] [--size N] [--windows corner,move]
+#        python -m gofish.patterns search <sgf file> --corner tl|tr|bl|br [--db FILE] [--size N]
+#        python -m gofish.patterns search <sgf file> --around Q16 [--db FILE] [--size N]
+#
+# The search command takes the window from the position at the end of the file's main line,
+# with the side to move being whoever didn't play last.
+#
+# A window's key is the side to move followed by its points (EMPTY, BLACK, WHITE, or OFFBOARD).
+# The stored key is the smallest over the window's allowed orientations (for a corner, the
+# identity and the diagonal reflection; for a move window, all 8) and over swapping colours
+# (which also swaps the side to move). The next move is stored in the same orientation, as an
+# index into the window, or one of the NEXT_ codes below.
+
+import argparse, collections, functools, hashlib, operator, os, sqlite3, sys
+
+from gofish.batch import *
+from gofish.fastboard import *
+from gofish.loader import *
+from gofish.positions import index_files
+from gofish.symmetry import *
+
+DEFAULT_DB = "gofish_patterns.db"
+DEFAULT_SIZE = 7
+
+NEXT_ELSEWHERE, NEXT_PASS, NEXT_NONE = -1, -2, -3
+
+CORNER, MOVE = "corner", "move"
+
+corners = {"tl": 0, "tr": 1, "bl": 2, "br": 3}      # The symmetry that takes the top left corner to each corner
+
+colour_swap = bytes([EMPTY, WHITE, BLACK, OFFBOARD]) + bytes(range(4, 256))
+
+schema = """
+CREATE TABLE IF NOT EXISTS games (
+    id          INTEGER PRIMARY KEY,
+    path        TEXT UNIQUE NOT NULL,
+    mtime       INTEGER NOT NULL,
+    size        INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS patterns (
+    hash        INTEGER NOT NULL,
+    move        INTEGER NOT NULL,
+    next        INTEGER NOT NULL,
+    game        INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS patterns_hash ON patterns (hash);
+CREATE INDEX IF NOT EXISTS patterns_game ON patterns (game);
+"""
+
+def open_pattern_index(db_filename = DEFAULT_DB):
+    conn = sqlite3.connect(db_filename)
+    conn.executescript(schema)
+    return conn
+
+
+@functools.lru_cache(maxsize = None)
+def local_permutations(size):
+
+    # For each symmetry, the permutation of a size x size window: transformed[j] = original[perm[j]].
+
+    perms = []
+    for symmetry in range(SYMMETRIES):
+        perm = []
+        for y in range(1, size + 1):
+            for x in range(1, size + 1):
+                tx, ty = transform_point(x, y, size, symmetry)
+                perm.append((ty - 1) * size + (tx - 1))
+        perms.append(perm)
+    return perms
+
+
+@functools.lru_cache(maxsize = None)
+def corner_indexes(boardsize, size, corner):        # Padded board indexes of a corner window, in the window's own order
+    table = padded_symmetry_tables(boardsize)[corners[corner]]
+    width = boardsize + 2
+    return [table[y * width + x] for y in range(1, size + 1) for x in range(1, size + 1)]
+
+
+def window_hash(kind, size, to_play, content):
+    key = "{}:{}:".format(kind, size).encode("ascii") + bytes([to_play]) + content
+    return int.from_bytes(hashlib.blake2b(key, digest_size = 8).digest(), "little") >> 1     # 63 bits, to fit SQLite
+
+
+def canonical_window(kind, size, to_play, content):
+
+    # Returns (hash, symmetry, swapped) for the smallest variant of the window.
+
+    perms = local_permutations(size)
+    symmetries = [0, 4] if kind == CORNER else range(SYMMETRIES)
+    best = None
+
+    for symmetry in symmetries:
+        transformed = bytes(operator.itemgetter(*perms[symmetry])(content))
+        for swapped in [False, True]:
+            if swapped:
+                key = bytes([to_play ^ 3]) + transformed.translate(colour_swap)
+            else:
+                key = bytes([to_play]) + transformed
+            if best is None or key < best[0]:
+                best = (key, symmetry, swapped)
+
+    key, symmetry, swapped = best
+    return window_hash(kind, size, key[0], key[1:]), symmetry, swapped
+
+
+def window_content(board, indexes):
+    return bytes(operator.itemgetter(*indexes)(board.state))
+
+
+def move_window(board, x, y, size):
+
+    # Returns (content, indexes) for a window centred on x, y. Points off the board are OFFBOARD,
+    # with index None.
+
+    half = size // 2
+    state = board.state
+    content = bytearray()
+    indexes = []
+    for j in range(y - half, y - half + size):
+        for i in range(x - half, x - half + size):
+            if 1 <= i <= board.boardsize and 1 <= j <= board.boardsize:
+                index = j * board.width + i
+                content.append(state[index])
+                indexes.append(index)
+            else:
+                content.append(OFFBOARD)
+                indexes.append(None)
+    return bytes(content), indexes
+
+
+def next_local(indexes, symmetry, size, next_index):
+
+    # Convert the board index of the next move into a position in the transformed window.
+
+    if next_index is None:
+        return NEXT_NONE
+    if next_index == 0:
+        return NEXT_PASS
+    try:
+        original = indexes.index(next_index)
+    except ValueError:
+        return NEXT_ELSEWHERE
+    return local_permutations(size)[symmetry].index(original)
+
+
+def windows_of_position(board, windows, size, last_move):
+
+    # Yields (kind, content, indexes) for every window of interest in the current position.
+    # Windows with no stones are skipped.
+
+    if CORNER in windows and board.boardsize >= size:
+        for corner in corners:
+            indexes = corner_indexes(board.boardsize, size, corner)
+            content = window_content(board, indexes)
+            if content.count(EMPTY) < len(content):
+                yield CORNER, content, indexes
+
+    if MOVE in windows and last_move:
+        x, y = board.point(last_move)
+        content, indexes = move_window(board, x, y, size)
+        if content.count(BLACK) or content.count(WHITE):
+            yield MOVE, content, indexes
+
+
+def pattern_task(path, windows = (CORNER,), size = DEFAULT_SIZE):       # Runs in a worker process
+
+    stat = os.stat(path)
+    root = load_sgf_mainline(path)
+    board = FastBoard(root.boardsize)
+
+    nodes = []
+    node = root
+    while node is not None:
+        nodes.append(node)
+        node = node.main_child()
+
+    rows = []
+    last_move = 0
+
+    for n, node in enumerate(nodes):
+
+        board.update_from_node(node)
+        coords = node.move_coords()
+        if coords:
+            last_move = board.index(*coords)
+
+        # What comes next, and who plays it...
+
+        next_index = None
+        if n + 1 < len(nodes):
+            following = nodes[n + 1]
+            next_colour = following.move_colour()
+            if next_colour is not None:
+                next_coords = following.move_coords()
+                next_index = board.index(*next_coords) if next_coords else 0
+        else:
+            next_colour = None
+
+        if next_colour is None:
+            next_colour = WHITE if node.last_colour_played() == BLACK else BLACK
+
+        for kind, content, indexes in windows_of_position(board, windows, size, last_move):
+            h, symmetry, swapped = canonical_window(kind, size, next_colour, content)
+            rows.append((h, node.moves_made, next_local(indexes, symmetry, size, next_index)))
+
+    return {"mtime": stat.st_mtime_ns, "size": stat.st_size, "rows": rows}
+
+
+def index_patterns(conn, directory, windows = (CORNER,), size = DEFAULT_SIZE, workers = None, chunk_size = 64):    # Returns (indexed, unchanged, removed, errors)
+    task = functools.partial(pattern_task, windows = tuple(windows), size = size)
+    return index_files(conn, directory, task, "patterns", ["hash", "move", "next"], workers, chunk_size)
+
+
+def search_window(conn, kind, size, to_play, content, indexes, boardsize):
+
+    # Returns (matches, next_moves): a sorted list of (path, move number), and a Counter of what
+    # was played next, keyed by board point (x, y), or "pass" / "elsewhere" / "end".
+
+    h, symmetry, swapped = canonical_window(kind, size, to_play, content)
+    perm = local_permutations(size)[symmetry]
+    width = boardsize + 2
+
+    matches = []
+    next_moves = collections.Counter()
+
+    sql = "SELECT games.path, patterns.move, patterns.next FROM patterns JOIN games ON games.id = patterns.game WHERE patterns.hash = ?"
+
+    for path, move, nxt in conn.execute(sql, (h,)):
+        matches.append((path, move))
+        if nxt >= 0:
+            index = indexes[perm[nxt]]          # Back to our own orientation, then to the board
+            if index is None:
+                next_moves["elsewhere"] += 1
+            else:
+                next_moves[(index % width, index // width)] += 1
+        else:
+            next_moves[{NEXT_ELSEWHERE: "elsewhere", NEXT_PASS: "pass", NEXT_NONE: "end"}[nxt]] += 1
+
+    return sorted(matches), next_moves
+
+
+def search_corner(conn, board, corner, to_play, size = DEFAULT_SIZE):     # board is a Board or FastBoard; corner is "tl", "tr", "bl" or "br"
+    fast = fastboard_from_board(board)
+    indexes = corner_indexes(fast.boardsize, size, corner)
+    return search_window(conn, CORNER, size, to_play, window_content(fast, indexes), indexes, fast.boardsize)
+
+
+def search_around(conn, board, x, y, to_play, size = DEFAULT_SIZE):       # A window centred on x, y, as indexed for each move
+    fast = fastboard_from_board(board)
+    content, indexes = move_window(fast, x, y, size)
+    return search_window(conn, MOVE, size, to_play, content, indexes, fast.boardsize)
+
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description = "Index local patterns in a directory of game records, and search the index.")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+
+    index_parser = subparsers.add_parser("index")
+    index_parser.add_argument("directory")
+    index_parser.add_argument("--db", default = DEFAULT_DB)
+    index_parser.add_argument("--size", type = int, default = DEFAULT_SIZE)
+    index_parser.add_argument("--windows", default = CORNER, help = "comma separated: corner, move")
+    index_parser.add_argument("--workers", type = int, default = None)
+
+    search_parser = subparsers.add_parser("search")
+    search_parser.add_argument("file", help = "a game record; the window is taken from the end of its main line")
+    search_parser.add_argument("--db", default = DEFAULT_DB)
+    search_parser.add_argument("--size", type = int, default = DEFAULT_SIZE)
+    search_parser.add_argument("--corner", choices = sorted(corners), default = None)
+    search_parser.add_argument("--around", default = None, help = "centre of the window, e.g. Q16")
+
+    args = parser.parse_args()
+    conn = open_pattern_index(args.db)
+
+    if args.command == "index":
+        windows = [w.strip() for w in args.windows.split(",")]
+        indexed, unchanged, removed, errors = index_patterns(conn, args.directory, windows, args.size, workers = args.workers)
+        print("{} indexed, {} unchanged, {} removed, {} unreadable".format(indexed, unchanged, removed, errors), file = sys.stderr)
+
+    else:
+        node = load(args.file).get_end_node()
+        board = node.board
+        to_play = WHITE if node.last_colour_played() == BLACK else BLACK
+
+        if args.corner:
+            matches, next_moves = search_corner(conn, board, args.corner, to_play, args.size)
+        elif args.around:
+            point = point_from_english_string(args.around, board.boardsize)
+            if point is None:
+                parser.error("bad point: {}".format(args.around))
+            matches, next_moves = search_around(conn, board, point[0], point[1], to_play, args.size)
+        else:
+            parser.error("need --corner or --around")
+
+        for path, move in matches:
+            print("{}\t{}".format(path, move))
+        print(file = sys.stderr)
+        for key, count in next_moves.most_common():
+            if isinstance(key, tuple):
+                key = english_string_from_point(key[0], key[1], board.boardsize)
+            print("{}\t{}".format(key, count), file = sys.stderr)
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+# An on-disk index of every whole-board position reached in the main lines of a collection,
+# so that finding the games that reach a position is a single indexed SQLite lookup.
+#
+# Usage: python -m gofish.positions index <directory> [--db FILE] [--workers N]
+#        python -m gofish.positions search <sgf file> [--db FILE] [--symmetries]
+#
+# The search command looks for the position at the end of the given file's main line.
+#
+# Each position is stored under its Zobrist hash and also under its canonical hash (the
+# smallest hash of its 8 symmetric versions), so a search can optionally match rotated and
+# reflected positions. The board size is stored too, since hashes don't depend on it. Like the archive index, re-indexing only loads changed files.
+
+import argparse, os, sqlite3, sys
+
+from gofish.batch import *
+from gofish.fastboard import *
+from gofish.loader import *
+
+DEFAULT_DB = "gofish_positions.db"
+
+schema = """
+CREATE TABLE IF NOT EXISTS games (
+    id          INTEGER PRIMARY KEY,
+    path        TEXT UNIQUE NOT NULL,
+    mtime       INTEGER NOT NULL,
+    size        INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS positions (
+    hash        INTEGER NOT NULL,
+    canonical   INTEGER NOT NULL,
+    boardsize   INTEGER NOT NULL,
+    game        INTEGER NOT NULL,
+    move        INTEGER NOT NULL
+);
+"""
+
+indexes = """
+CREATE INDEX IF NOT EXISTS positions_hash ON positions (hash);
+CREATE INDEX IF NOT EXISTS positions_canonical ON positions (canonical);
+CREATE INDEX IF NOT EXISTS positions_game ON positions (game);
+"""
+
+def open_position_index(db_filename = DEFAULT_DB):
+    conn = sqlite3.connect(db_filename)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(positions)")]
+    if columns and "boardsize" not in columns:      # An index from before positions had a boardsize; start again
+        conn.executescript("DROP TABLE positions; DROP TABLE games;")
+    conn.executescript(schema + indexes)
+    return conn
+
+
+def position_task(path):        # Runs in a worker process; replays the main line once
+
+    stat = os.stat(path)
+    root = load_sgf_mainline(path)
+    board = FastBoard(root.boardsize, symmetric_hashes = True)
+
+    positions = []
+    seen = set()
+    node = root
+
+    while 1:
+        board.update_from_node(node)
+        key = (board.hash, node.moves_made)
+        if key not in seen:             # e.g. a node without a move repeats the previous position
+            seen.add(key)
+            positions.append((board.hash, board.canonical_hash(), root.boardsize, node.moves_made))
+        if len(node.children) == 0:
+            break
+        node = node.children[0]
+
+    return {"mtime": stat.st_mtime_ns, "size": stat.st_size, "rows": positions}
+
+
+def index_positions(conn, directory, workers = None, chunk_size = 64):      # Returns (indexed, unchanged, removed, errors)
+    return index_files(conn, directory, position_task, "positions", ["hash", "canonical", "boardsize", "move"], workers, chunk_size)
+
+
+def index_files(conn, directory, task, table, columns, workers = None, chunk_size = 64):
+
+    # Shared by the position and pattern indexes. The task returns the file's mtime and size,
+    # and "rows" for the table, in the order of columns; a "game" column is added to each row.
+    # A file that fails to load still gets a games row (with no rows in the table) so it isn't
+    # retried until it changes. Returns (indexed, unchanged, removed, errors)
+
+    directory = os.path.abspath(directory)
+
+    known = dict()
+    for game_id, path, mtime, size in conn.execute("SELECT id, path, mtime, size FROM games"):
+        known[path] = (game_id, mtime, size)
+
+    to_load = []
+    unchanged = 0
+    seen = set()
+
+    for path in find_files(directory):
+        seen.add(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if path in known and known[path][1:] == (stat.st_mtime_ns, stat.st_size):
+            unchanged += 1
+        else:
+            to_load.append(path)
+
+    indexed = 0
+    errors = 0
+
+    sql = "INSERT INTO {} ({}, game) VALUES ({}?)".format(table, ", ".join(columns), "?, " * len(columns))
+
+    def forget(path):
+        conn.execute("DELETE FROM {} WHERE game = ?".format(table), (known[path][0],))
+        conn.execute("DELETE FROM games WHERE id = ?", (known[path][0],))
+
+    for record in run_batch(task, to_load, workers = workers, chunk_size = chunk_size):
+        path = record["path"]
+        if path in known:
+            forget(path)
+        if not record["ok"]:
+            errors += 1
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            record["mtime"], record["size"], record["rows"] = stat.st_mtime_ns, stat.st_size, []
+        cursor = conn.execute("INSERT INTO games (path, mtime, size) VALUES (?, ?, ?)", (path, record["mtime"], record["size"]))
+        game_id = cursor.lastrowid
+        conn.executemany(sql, [row + (game_id,) for row in record["rows"]])
+        if record["ok"]:
+            indexed += 1
+
+    # Forget files under this directory that no longer exist (other directories may share the index)...
+
+    prefix = os.path.join(directory, "")
+    removed = [path for path in known if path.startswith(prefix) and path not in seen]
+    for path in removed:
+        forget(path)
+
+    conn.commit()
+    return indexed, unchanged, len(removed), errors
+
+
+def search_position(conn, board, symmetries = False):
+
+    # board can be a Board or FastBoard. Returns a list of (path, move number).
+
+    fast = fastboard_from_board(board, symmetric_hashes = symmetries)
+
+    if symmetries:
+        sql = "SELECT games.path, positions.move FROM positions JOIN games ON games.id = positions.game WHERE positions.canonical = ? AND positions.boardsize = ?"
+        h = fast.canonical_hash()
+    else:
+        sql = "SELECT games.path, positions.move FROM positions JOIN games ON games.id = positions.game WHERE positions.hash = ? AND positions.boardsize = ?"
+        h = fast.hash
+
+    return sorted(conn.execute(sql, (h, fast.boardsize)).fetchall())      # Every empty board hashes to 0, whatever its size
+
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description = "Index every main line position in a directory of game records, and search the index.")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+
+    index_parser = subparsers.add_parser("index")
+    index_parser.add_argument("directory")
+    index_parser.add_argument("--db", default = DEFAULT_DB)
+    index_parser.add_argument("--workers", type = int, default = None)
+
+    search_parser = subparsers.add_parser("search")
+    search_parser.add_argument("file", help = "a game record; the position at the end of its main line is searched for")
+    search_parser.add_argument("--db", default = DEFAULT_DB)
+    search_parser.add_argument("--symmetries", action = "store_true", help = "also match rotations and reflections")
+
+    args = parser.parse_args()
+    conn = open_position_index(args.db)
+
+    if args.command == "index":
+        indexed, unchanged, removed, errors = index_positions(conn, args.directory, workers = args.workers)
+        print("{} indexed, {} unchanged, {} removed, {} unreadable".format(indexed, unchanged, removed, errors), file = sys.stderr)
+    else:
+        node = load(args.file).get_end_node()
+        for path, move in search_position(conn, node.board, symmetries = args.symmetries):
+            print("{}\t{}".format(path, move))
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# GameRecord: a compact main-line-only form of a game, for bulk jobs that don't need variations,
+# markup, or a board at every node. Root properties are kept (one value per key), and moves and
+# root setup stones are arrays of encode_move() ints, so a typical game is well under 1 KB.
+#
+# SGF is read straight into a GameRecord from the parser's events, with no Node objects built.
+# The other formats are small and have no variations, so they go through their usual parsers.
+
+import array
+
+from gofish.constants import *
+from gofish.fastboard import *
+from gofish.loader import *
+from gofish.sgf import *
+from gofish.tree import *
+from gofish.utils import *
+
+setup_keys = {"AB": BLACK, "AW": WHITE, "AE": EMPTY}
+move_keys = {"B": BLACK, "W": WHITE}
+
+class GameRecord():
+
+    __slots__ = ["properties", "boardsize", "setup", "moves"]
+
+    def __init__(self, boardsize = 19):
+        self.properties = dict()            # key ---> single value, e.g. "PB" ---> "Honinbo Shusaku"
+        self.boardsize = boardsize
+        self.setup = array.array("H")       # encode_move(colour, x, y), with colour EMPTY for AE
+        self.moves = array.array("H")       # encode_move(colour, x, y), with x = y = 0 for a pass
+
+    def __len__(self):
+        return len(self.moves)
+
+    def get_value(self, key):
+        return self.properties.get(key)
+
+    def add_setup(self, key, value):
+        colour = setup_keys[key]
+        for x, y in sorted(points_from_points_string(value, self.boardsize)):
+            self.setup.append(encode_move(colour, x, y))
+
+    def add_move(self, key, value):
+        x, y = 0, 0
+        if len(value) >= 2:
+            x = ord(value[0]) - 96
+            y = ord(value[1]) - 96
+            if x < 1 or x > self.boardsize or y < 1 or y > self.boardsize:     # e.g. W[tt]
+                x, y = 0, 0
+        self.moves.append(encode_move(move_keys[key], x, y))
+
+    def replay(self, board = None):
+
+        # Yields a FastBoard after the setup and after each move (the same board object each time,
+        # so copy anything that needs keeping). Pass in a board to use, e.g. one with symmetric hashes.
+
+        if board is None:
+            board = FastBoard(self.boardsize)
+        for code in self.setup:
+            colour, x, y = decode_move(code)
+            board.set_stone(colour, x, y)
+        yield board
+        for code in self.moves:
+            board.play_code(code)
+            yield board
+
+    def to_node(self):                      # Returns the root of a new tree
+        root = Node(parent = None)
+        for key, value in self.properties.items():
+            root.set_value(key, value)
+        for code in self.setup:
+            colour, x, y = decode_move(code)
+            root.add_value({BLACK: "AB", WHITE: "AW", EMPTY: "AE"}[colour], string_from_point(x, y))
+        node = root
+        for code in self.moves:
+            colour, x, y = decode_move(code)
+            node = Node(parent = node)
+            node.set_value("B" if colour == BLACK else "W", string_from_point(x, y) if x else "")
+        cleanup(root)
+        return root
+
+
+def record_from_node(node):
+
+    # Any node of the tree will do; the main line is taken from the root. Setup stones after
+    # the root, and everything else in non-root nodes apart from the moves, is dropped.
+
+    root = node.get_root_node()
+    record = GameRecord(root.boardsize)
+
+    for key, values in root.properties.items():
+        if key in setup_keys:
+            for value in values:
+                record.add_setup(key, value)
+        elif key not in move_keys:
+            record.properties[key] = values[0]
+
+    node = root
+    while 1:
+        for key in move_keys:
+            if key in node.properties:
+                record.add_move(key, node.properties[key][0])
+        if len(node.children) == 0:
+            break
+        node = node.children[0]
+
+    return record
+
+
+def record_from_sgf(sgf):
+
+    root_values = []            # (key, value) pairs of the root node, held until it's complete and the size is known
+    record = None
+    nodes = 0
+
+    for key, value in sgf_mainline_events(sgf):
+        if key is None:
+            nodes += 1
+            if nodes == 2:
+                record = record_from_root_values(root_values)
+        elif nodes == 1:
+            root_values.append((key, value))
+        elif key in move_keys:
+            record.add_move(key, value)
+
+    if nodes == 0:
+        raise ParserFail
+
+    if record is None:
+        record = record_from_root_values(root_values)
+
+    return record
+
+
+def record_from_root_values(values):
+
+    # Same effect as loading the root node and calling cleanup() on it.
+
+    properties = dict()
+    for key, value in values:
+        if key not in properties and (value != "" or key in move_keys):
+            properties[key] = value
+
+    try:
+        size = int(properties.get("SZ", "19"))
+    except ValueError:
+        raise BadBoardSize
+    if size > 19 or size < 1:
+        raise BadBoardSize
+
+    properties["FF"] = "4"
+    properties["GM"] = "1"
+    properties["CA"] = "UTF-8"
+    properties["SZ"] = str(size)
+
+    record = GameRecord(size)
+
+    for key, value in values:
+        if key in setup_keys:
+            record.add_setup(key, value)
+        elif key in move_keys and properties.pop(key, None) is not None:     # A move in the root node is unusual, but legal
+            record.add_move(key, value)
+
+    for key, value in properties.items():
+        if key not in setup_keys:
+            record.properties[key] = value
+
+    return record
+
+
+def load_record(filename):
+
+    contents, fmt = read_source(filename)
+
+    if fmt == SGF:
+        return record_from_sgf(contents)
+
+    root = formats[fmt][0](contents)
+    cleanup(root)
+    return record_from_node(root)
@@ -1,19 +1,110 @@
+import re
+
 from gofish.constants import *
 from gofish.tree import *
 
+escape_regex = re.compile(r"\\(.)", re.DOTALL)
+token_regex = re.compile(r"\[([^\\\]]*(?:\\.[^\\\]]*)*)\]|([;()])|([A-Z]+)", re.DOTALL)   # A value (escape-aware), punctuation, or key letters
+
+
+def value_end(sgf, i):          # Given the index just after a "[", return the index of the matching (unescaped) "]"
+    while 1:
+        j = sgf.find("]", i)
+        if j == -1:
+            raise ParserFail
+        slashes = 0
+        k = j - 1
+        while sgf[k] == "\\":      # The "[" that opened the value stops this loop, if nothing else does
+            slashes += 1
+            k -= 1
+        if slashes % 2 == 0:
+            return j
+        i = j + 1
+
+
+def sgf_header_end(sgf):        # Return the index just past the root node, or -1 if the text ends before the root node does
+    i = sgf.find(";")
+    if i == -1:
+        return -1
+    i += 1
+    length = len(sgf)
+    while i < length:
+        c = sgf[i]
+        if c == "[":
+            try:
+                i = value_end(sgf, i + 1) + 1
+            except ParserFail:
+                return -1
+            continue
+        if c in ";()":
+            return i
+        i += 1
+    return -1
+
 
 def parse_sgf(sgf, main_line_only = False):
     sgf = sgf.strip()
     sgf = sgf.lstrip("(")       # the load_sgf_tree() function assumes the leading "(" has already been read and discarded
 
     if main_line_only:
-        root, __ = load_sgf_tree(sgf, None, main_line_only = True)
+        root = load_sgf_mainline_tree(sgf)
     else:
         root, __ = load_sgf_tree(sgf, None)
 
     return root
 
 
+def sgf_mainline_events(sgf):
+
+    # Yields (None, None) at the start of each main line node, then (key, value) for each of its
+    # properties. Values are matched whole by the regex rather than walked one character at a time.
+    # The main line is always the first child, and it ends at the first ")" outside a value,
+    # so side variations (which all come after that point) are never looked at.
+
+    started = False
+    key = ""
+    keycomplete = False
+
+    for match in token_regex.finditer(sgf):
+        value, punctuation, letters = match.groups()
+        if value is not None:
+            if not started:
+                raise ParserFail
+            if "\\" in value:
+                value = escape_regex.sub(r"\1", value)      # Discard the escape slashes
+            yield key, value
+            keycomplete = True
+        elif letters is not None:
+            if keycomplete:                 # Other chars are skipped, e.g. AddWhite becomes AW
+                key = ""
+                keycomplete = False
+            key += letters
+        elif punctuation == ";":
+            started = True
+            yield None, None
+        elif punctuation == ")":
+            break
+
+
+def load_sgf_mainline_tree(sgf):
+
+    root = None
+    node = None
+
+    for key, value in sgf_mainline_events(sgf):
+        if key is None:
+            node = Node(parent = node)
+            if root is None:
+                root = node
+        else:
+            node.add_value(key, value)
+
+    if root is None:
+        raise ParserFail
+
+    return root
+
+
 def load_sgf_tree(sgf, parent_of_local_root, main_line_only = False):   # The caller should ensure there is no leading "("
 
     root = None
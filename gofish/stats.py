@@ -0,0 +1,184 @@
+# Statistics over a collection of game records: results by colour, komi and handicap, game
+# lengths, first moves, and a heatmap of where moves are played.
+#
+# Usage: python -m gofish.stats <directory> [--format json|csv] [--output FILE] [--header-only] [--workers N]
+#
+# Files are read in worker processes as GameRecords (or, with --header-only, just their root
+# node, which skips lengths, first moves and the heatmap), and only small per-game summaries
+# come back, so memory use doesn't grow with the size of the collection. The heatmap uses
+# NumPy if it's installed.
+
+import argparse, collections, csv, json, sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from gofish.batch import *
+from gofish.loader import *
+from gofish.record import *
+
+HEATMAP_SIZE = 19           # Only games on this size of board go into the heatmap
+
+def winner(result):         # "B+R" ---> "B", "0" or "Draw" ---> "draw", missing or odd ---> "unknown"
+    if not result:
+        return "unknown"
+    result = result.strip().upper()
+    if result[:2] in ["B+", "W+"]:
+        return result[0]
+    if result in ["0", "DRAW", "JIGO"]:
+        return "draw"
+    return "unknown"
+
+
+def black_win_rate(counter):       # Among decisive games; None if there are none
+    decisive = counter["B"] + counter["W"]
+    if decisive == 0:
+        return None
+    return counter["B"] / decisive
+
+
+def summary(properties):
+    return {
+        "winner": winner(properties.get("RE")),
+        "komi": properties.get("KM"),
+        "handicap": properties.get("HA", "0"),
+        "boardsize": properties.get("SZ", "19"),
+    }
+
+
+def stats_task(path):                   # Runs in a worker process
+    record = load_record(path)
+    result = summary(record.properties)
+    result["length"] = len(record.moves)
+    result["first"] = None
+    for code in record.moves:
+        colour, x, y = decode_move(code)
+        if x:
+            result["first"] = string_from_point(x, y)
+            break
+    result["moves"] = record.moves
+    return result
+
+
+def header_stats_task(path):
+    root = load_header(path)
+    return summary({key: root.get_value(key) for key in root.properties})
+
+
+class Stats():
+
+    def __init__(self):
+        self.games = 0
+        self.errors = 0
+        self.results = collections.Counter()
+        self.by_komi = collections.defaultdict(collections.Counter)
+        self.by_handicap = collections.defaultdict(collections.Counter)
+        self.by_boardsize = collections.Counter()
+        self.lengths = collections.Counter()
+        self.first_moves = collections.Counter()
+        if np is not None:
+            self.heat = np.zeros(3 << 10, dtype = np.int64)     # Indexed by encode_move() value
+        else:
+            self.heat = collections.Counter()
+
+    def add(self, record):
+        if not record["ok"]:
+            self.errors += 1
+            return
+        self.games += 1
+        self.results[record["winner"]] += 1
+        self.by_komi[record["komi"] or "none"][record["winner"]] += 1
+        self.by_handicap[record["handicap"]][record["winner"]] += 1
+        self.by_boardsize[record["boardsize"]] += 1
+        if "length" in record:
+            self.lengths[record["length"]] += 1
+            if record["first"]:
+                self.first_moves[record["first"]] += 1
+            if record["boardsize"] == str(HEATMAP_SIZE):
+                if np is not None:
+                    self.heat += np.bincount(np.frombuffer(record["moves"], dtype = np.uint16), minlength = 3 << 10)
+                else:
+                    self.heat.update(record["moves"])
+
+    def heatmap(self, colour):          # [y][x] lists of counts, 0-based
+        return [[int(self.heat[encode_move(colour, x, y)]) for x in range(1, HEATMAP_SIZE + 1)] for y in range(1, HEATMAP_SIZE + 1)]
+
+    def as_dict(self):
+        return {
+            "games": self.games,
+            "errors": self.errors,
+            "results": dict(self.results),
+            "black_win_rate": black_win_rate(self.results),
+            "by_komi": {k: dict(v, black_win_rate = black_win_rate(v)) for k, v in sorted(self.by_komi.items())},
+            "by_handicap": {k: dict(v, black_win_rate = black_win_rate(v)) for k, v in sorted(self.by_handicap.items())},
+            "by_boardsize": dict(self.by_boardsize),
+            "lengths": {str(k): v for k, v in sorted(self.lengths.items())},
+            "first_moves": dict(self.first_moves.most_common()),
+            "heatmap": {"black": self.heatmap(BLACK), "white": self.heatmap(WHITE)},
+        }
+
+    def csv_rows(self):                 # Rows of (section, key, subkey, count)
+        yield ("games", "", "", self.games)
+        yield ("errors", "", "", self.errors)
+        for k, v in self.results.items():
+            yield ("results", k, "", v)
+        for name, table in [("by_komi", self.by_komi), ("by_handicap", self.by_handicap)]:
+            for k, counter in sorted(table.items()):
+                for w, v in counter.items():
+                    yield (name, k, w, v)
+        for k, v in self.by_boardsize.items():
+            yield ("by_boardsize", k, "", v)
+        for k, v in sorted(self.lengths.items()):
+            yield ("lengths", k, "", v)
+        for k, v in self.first_moves.most_common():
+            yield ("first_moves", k, "", v)
+        for colour, name in [(BLACK, "heatmap_black"), (WHITE, "heatmap_white")]:
+            for y, row in enumerate(self.heatmap(colour)):
+                for x, v in enumerate(row):
+                    if v:
+                        yield (name, string_from_point(x + 1, y + 1), "", v)
+
+
+def collect_stats(paths, header_only = False, workers = None, chunk_size = 64, throughput = None):
+    stats = Stats()
+    task = header_stats_task if header_only else stats_task
+    for record in run_batch(task, paths, workers = workers, chunk_size = chunk_size):
+        stats.add(record)
+        if throughput:
+            throughput.add(record)
+    return stats
+
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description = "Aggregate statistics over a directory of game records.")
+    parser.add_argument("directory")
+    parser.add_argument("--format", choices = ["json", "csv"], default = "json")
+    parser.add_argument("--output", default = None, help = "output file (default stdout)")
+    parser.add_argument("--header-only", action = "store_true", help = "only read root properties (results, komi, handicap)")
+    parser.add_argument("--workers", type = int, default = None)
+    args = parser.parse_args()
+
+    throughput = Throughput()
+    stats = collect_stats(find_files(args.directory), args.header_only, workers = args.workers, throughput = throughput)
+
+    outfile = open(args.output, "w", encoding = "utf-8", newline = "") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump(stats.as_dict(), outfile, ensure_ascii = False)
+            outfile.write("\n")
+        else:
+            writer = csv.writer(outfile)
+            writer.writerow(["section", "key", "subkey", "count"])
+            writer.writerows(stats.csv_rows())
+    finally:
+        if outfile is not sys.stdout:
+            outfile.close()
+
+    throughput.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# The 8 symmetries of a square board, for Boards, FastBoards, property values and whole trees.
+# Symmetry 0 is the identity. Bit 4 swaps x and y, then bit 1 flips x and bit 2 flips y.
+#
+# Everything is driven by permutation tables built once per board size, so transforming a
+# board is an array take rather than arithmetic on every point.
+
+import operator
+
+from gofish.constants import *
+from gofish.tree import *
+from gofish.utils import *
+
+SYMMETRIES = 8
+
+def transform_point(x, y, boardsize, symmetry):     # Works on 1-based coordinates, e.g. 16, 4
+    n = boardsize + 1
+    if symmetry & 4:
+        x, y = y, x
+    if symmetry & 1:
+        x = n - x
+    if symmetry & 2:
+        y = n - y
+    return x, y
+
+
+padded_tables = dict()
+
+def padded_symmetry_tables(boardsize):
+
+    # For each symmetry, a list mapping every index of a padded board (see fastboard.py, where
+    # index = y * (boardsize + 2) + x) to the index it moves to. Off-board indexes map to themselves.
+    # Built once per board size.
+
+    try:
+        return padded_tables[boardsize]
+    except KeyError:
+        pass
+
+    width = boardsize + 2
+    tables = []
+    for symmetry in range(SYMMETRIES):
+        table = list(range(width * width))
+        for x in range(1, boardsize + 1):
+            for y in range(1, boardsize + 1):
+                tx, ty = transform_point(x, y, boardsize, symmetry)
+                table[y * width + x] = ty * width + tx
+        tables.append(table)
+
+    padded_tables[boardsize] = tables
+    return tables
+
+
+def inverse_symmetry(symmetry):     # Only the two 90 degree rotations aren't their own inverse
+    return {5: 6, 6: 5}.get(symmetry, symmetry)
+
+# ---------------------------------------------------------------------------
+# Boards. A Board's state is flattened column by column (index = x * (boardsize + 1) + y) and
+# transformed with a single operator.itemgetter() call over a precomputed permutation.
+
+board_tables = dict()
+
+def board_symmetry_tables(boardsize):
+
+    # For each symmetry, the permutation such that transformed_flat[j] = flat[perm[j]].
+
+    try:
+        return board_tables[boardsize]
+    except KeyError:
+        pass
+
+    height = boardsize + 1
+    tables = []
+    for symmetry in range(SYMMETRIES):
+        inverse = inverse_symmetry(symmetry)
+        perm = list(range(height * height))
+        for x in range(1, boardsize + 1):
+            for y in range(1, boardsize + 1):
+                sx, sy = transform_point(x, y, boardsize, inverse)
+                perm[x * height + y] = sx * height + sy
+        tables.append(operator.itemgetter(*perm))
+    board_tables[boardsize] = tables
+    return tables
+
+
+def flat_state(board):
+    flat = []
+    for column in board.state:
+        flat.extend(column)
+    return flat
+
+
+def transform_board(board, symmetry):           # Returns a new Board
+    boardsize = board.boardsize
+    height = boardsize + 1
+    flat = board_symmetry_tables(boardsize)[symmetry](flat_state(board))
+    result = Board(boardsize)
+    result.state = [list(flat[x * height:(x + 1) * height]) for x in range(height)]
+    return result
+
+
+def canonical_board(board):
+
+    # Returns (key, symmetry): key is the smallest flattened state over the 8 symmetries
+    # (a tuple, usable as a dict key), and symmetry is one that produces it.
+
+    flat = flat_state(board)
+    best = None
+    for symmetry, take in enumerate(board_symmetry_tables(board.boardsize)):
+        key = take(flat)
+        if best is None or key < best[0]:
+            best = (key, symmetry)
+    return best
+
+# ---------------------------------------------------------------------------
+# Nodes and trees.
+
+point_keys = {"B", "W", "AB", "AW", "AE", "TR", "CR", "SQ", "MA", "SL", "TB", "TW", "DD", "VW"}     # Points, or compressed point lists like "cd:jf"
+line_keys = {"AR", "LN"}                                                                            # "aa:bb", from one point to another
+label_keys = {"LB"}                                                                                 # "pd:text"
+
+string_tables = dict()
+
+def point_string_tables(boardsize):     # For each symmetry, a dict: "pd" ---> transformed string
+    try:
+        return string_tables[boardsize]
+    except KeyError:
+        pass
+    tables = []
+    for symmetry in range(SYMMETRIES):
+        table = dict()
+        for x in range(1, boardsize + 1):
+            for y in range(1, boardsize + 1):
+                table[string_from_point(x, y)] = string_from_point(*transform_point(x, y, boardsize, symmetry))
+        tables.append(table)
+    string_tables[boardsize] = tables
+    return tables
+
+
+def transform_value(key, value, boardsize, symmetry):
+
+    # Anything that isn't a point on the board (e.g. a pass, "tt", or an unknown key) is returned unchanged.
+
+    table = point_string_tables(boardsize)[symmetry]
+
+    if key in point_keys:
+        if len(value) == 5 and value[2] == ":":
+            a = table.get(value[0:2])
+            b = table.get(value[3:5])
+            if a is None or b is None:
+                return value
+            left, right = sorted([a[0], b[0]])      # Keep the rectangle in top-left:bottom-right form
+            top, bottom = sorted([a[1], b[1]])
+            return left + top + ":" + right + bottom
+        return table.get(value, value)
+
+    if key in line_keys:
+        if len(value) == 5 and value[2] == ":":
+            return table.get(value[0:2], value[0:2]) + ":" + table.get(value[3:5], value[3:5])
+        return value
+
+    if key in label_keys:
+        return table.get(value[0:2], value[0:2]) + value[2:]
+
+    return value
+
+
+def transform_properties(properties, boardsize, symmetry):     # Returns a new properties dict
+    result = dict()
+    for key, values in properties.items():
+        result[key] = [transform_value(key, value, boardsize, symmetry) for value in values]
+    return result
+
+
+def transform_tree(node, symmetry):
+
+    # Transform every node of the tree that contains node, in place. Cached boards are dropped,
+    # to be rebuilt when next needed.
+
+    root = node.get_root_node()
+    boardsize = root.boardsize
+
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        node.properties = transform_properties(node.properties, boardsize, symmetry)
+        node.board = None
+        stack.extend(node.children)
+
+    return root
@@ -1,5 +1,6 @@
-import copy
+import array, copy
 
+from gofish.compress import *
 from gofish.constants import *
 from gofish.utils import *
 
@@ -720,9 +721,77 @@ def new_tree(size):             # Returns a ready-to-use tree with board
     return root
 
 
+def main_line_moves(node):
+
+    # Return an array of encode_move() ints for the moves in the main line (after this node).
+    # Moves outside the board are stored as passes.
+
+    boardsize = node.boardsize
+    moves = array.array("H")
+
+    while len(node.children) > 0:
+        node = node.children[0]
+        for key, colour in [("B", BLACK), ("W", WHITE)]:
+            if key in node.properties:
+                movestring = node.properties[key][0]
+                x, y = 0, 0
+                if len(movestring) >= 2:
+                    x = ord(movestring[0]) - 96
+                    y = ord(movestring[1]) - 96
+                    if x < 1 or x > boardsize or y < 1 or y > boardsize:
+                        x, y = 0, 0
+                moves.append(encode_move(colour, x, y))
+
+    return moves
+
+
+def area_score(board, komi):        # Black's area minus White's, minus komi; assumes every stone on the board is alive
+
+    size = board.boardsize
+    area = {BLACK: 0, WHITE: 0}
+    seen = set()
+
+    for x in range(1, size + 1):
+        for y in range(1, size + 1):
+            colour = board.state[x][y]
+            if colour != EMPTY:
+                area[colour] += 1
+                continue
+            if (x, y) in seen:
+                continue
+            region = [(x, y)]                   # Flood fill this empty region, noting which colours touch it
+            seen.add((x, y))
+            borders = set()
+            n = 0
+            while n < len(region):
+                for p in adjacent_points(*region[n], size):
+                    c = board.state[p[0]][p[1]]
+                    if c == EMPTY:
+                        if p not in seen:
+                            seen.add(p)
+                            region.append(p)
+                    else:
+                        borders.add(c)
+                n += 1
+            if len(borders) == 1:
+                area[borders.pop()] += len(region)
+
+    return area[BLACK] - area[WHITE] - komi
+
+
+def result_string(score):           # From area_score()
+    if score > 0:
+        return "B+{:g}".format(score)
+    if score < 0:
+        return "W+{:g}".format(-score)
+    return "0"
+
+
+WRITE_CHUNK = 65536
+
 def save_file(filename, node):
     node = node.get_root_node()
-    with open(filename, "w", encoding="utf-8") as outfile:
+    with open_text_for_writing(filename, encoding="utf-8") as outfile:     # Compressed if the name ends in .gz .bz2 or .xz
         write_tree(outfile, node)
 
 
@@ -730,22 +799,59 @@ def save(filename, node):           # This should have been the name in the firs
     save_file(filename, node)
 
 
-def write_tree(outfile, node):
-    outfile.write("(")
-    while 1:
-        outfile.write(";")
-        for key in node.properties:
-            outfile.write(key)
-            for value in node.properties[key]:
-                outfile.write("[{}]".format(safe_string(value)))
-        if len(node.children) > 1:
-            for child in node.children:
-                write_tree(outfile, child)
-            break
-        elif len(node.children) == 1:
-            node = node.children[0]
+def sgf_chunks(node, chunk_size = WRITE_CHUNK):
+
+    # Generate the SGF text of the tree below (and including) this node, in pieces of roughly chunk_size
+    # characters. The walk is iterative: the stack holds nodes still to be written, and None wherever
+    # a ")" is due after the subtrees above it on the stack.
+
+    pieces = []
+    size = 0
+    stack = [node]
+
+    while stack:
+        node = stack.pop()
+        if node is None:
+            pieces.append(")")
+            size += 1
             continue
-        else:
-            break
-    outfile.write(")")
-    return
+        pieces.append("(")
+        while 1:
+            pieces.append(";")
+            size += 2
+            for key, values in node.properties.items():
+                s = key + "".join(["[" + safe_string(value) + "]" for value in values])
+                pieces.append(s)
+                size += len(s)
+            if size >= chunk_size:
+                yield "".join(pieces)
+                pieces = []
+                size = 0
+            if len(node.children) > 1:
+                stack.append(None)
+                stack.extend(reversed(node.children))
+                break
+            elif len(node.children) == 1:
+                node = node.children[0]
+                continue
+            else:
+                pieces.append(")")
+                break
+
+    if pieces:
+        yield "".join(pieces)
+
+
+def sgf_string(node):               # The whole SGF text of the tree below this node
+    return "".join(sgf_chunks(node))
+
+
+def sgf_bytes(node, encoding = "utf-8"):
+    return sgf_string(node).encode(encoding)
+
+
+def write_tree(outfile, node, encoding = None):     # Give an encoding if outfile is a binary file
+    for chunk in sgf_chunks(node):
+        if encoding:
+            chunk = chunk.encode(encoding)
+        outfile.write(chunk)
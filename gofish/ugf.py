@@ -1,10 +1,19 @@
 # This format better documented than some, see:
 # http://homepages.cwi.nl/~aeb/go/misc/ugf.html
 
+import re
+
 from gofish.constants import *
 from gofish.tree import *
 
-def parse_ugf(ugf):     # Note that the files are often (always?) named .ugi
+def ugf_header_end(ugf):        # Return the index of the [Data] section marker, or -1 if there is none in the text
+    match = re.search(r"^[ \t]*\[DATA\]", ugf, re.MULTILINE | re.IGNORECASE)
+    if match is None:
+        return -1
+    return match.start()
+
+
+def parse_ugf(ugf, header_only = False):     # Note that the files are often (always?) named .ugi
 
     root = Node(parent = None)
     node = root
@@ -39,6 +48,9 @@ def parse_ugf(ugf):     # Note that the files are often (always?) named .ugi
                     if handicap < 0:
                         raise ParserFail
 
+                    if header_only:
+                        break
+
                 continue
 
         except IndexError:
@@ -138,7 +150,7 @@ def parse_ugf(ugf):     # Note that the files are often (always?) named .ugi
                 key = colour
                 node.set_value(key, value)
 
-    if len(root.children) == 0:     # We'll assume we failed in this case
+    if len(root.children) == 0 and not header_only:     # We'll assume we failed in this case
         raise ParserFail
 
     return root
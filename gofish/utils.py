@@ -117,14 +117,16 @@ def adjacent_points(x, y, boardsize):
     return result
 
 
+def encode_move(colour, x, y):                      # BLACK, 16, 4  --->    single int; use x = y = 0 for a pass
+    return (colour << 10) | (y << 5) | x
+
+
+def decode_move(code):                              # Inverse of the above, giving (colour, x, y)
+    return code >> 10, code & 31, (code >> 5) & 31
+
+
 def safe_string(s):     # "safe" meaning safely escaped \ and ] characters
-    s = str(s)
-    safe_s = ""
-    for ch in s:
-        if ch in ["\\", "]"]:
-            safe_s += "\\"
-        safe_s += ch
-    return safe_s
+    return str(s).replace("\\", "\\\\").replace("]", "\\]")
 
 
 def handicap_points(boardsize, handicap, tygem = False):
@@ -0,0 +1,210 @@
+# Checking game records for problems that load() silently accepts: bad board sizes, illegal
+# moves (onto an occupied point, ko recaptures, suicide), malformed or off-board moves, and
+# text after the game tree. Every node of every variation is replayed on a FastBoard, undoing
+# back to each branch point, so no board is ever copied.
+#
+# Usage: python -m gofish.validate <directory or file> [--repair DIR] [--workers N]
+#
+# Output is one line per problem: file, node path (the child index taken at each node from
+# the root, e.g. 0.0.1.0), move number, and description. With --repair, every file that had
+# problems is written as SGF into DIR with what can be fixed fixed: a bad SZ is removed, text
+# after the tree is dropped, and malformed or off-board moves become passes. Illegal moves are
+# left alone, since there's no way to know what was meant.
+
+import argparse, functools, os, sys
+
+from gofish.batch import *
+from gofish.fastboard import *
+from gofish.loader import *
+from gofish.sgf import *
+
+class Problem():
+    def __init__(self, node, move_number, description, fixed = False):
+        self.node = node
+        self.move_number = move_number
+        self.description = description
+        self.fixed = fixed
+
+    def path_string(self):
+        if self.node is None:
+            return "-"
+        indexes = []
+        node = self.node
+        while node.parent:
+            indexes.append(node.parent.children.index(node))
+            node = node.parent
+        return ".".join(str(i) for i in reversed(indexes)) or "root"
+
+    def as_dict(self):
+        return {"node": self.path_string(), "move": self.move_number, "problem": self.description, "fixed": self.fixed}
+
+
+def check_boardsize(root, problems, repair):        # Returns the size to replay with, or None if that's impossible
+    sz = root.get_value("SZ")
+    if sz is None:
+        return 19
+    try:
+        size = int(sz)
+    except ValueError:
+        problems.append(Problem(root, 0, "unreadable SZ[{}]".format(sz), fixed = repair))
+        if repair:
+            root.delete_property("SZ")
+        return 19
+    if size < 1 or size > 19:
+        problems.append(Problem(root, 0, "unsupported SZ[{}]".format(sz)))
+        return None
+    return size
+
+
+def check_node(board, node, move_number, problems, repair):
+
+    # Checks and then applies the node to the board. Returns the move number after it.
+
+    movers = [key for key in ["B", "W"] if key in node.properties]
+
+    if len(movers) > 1:
+        problems.append(Problem(node, move_number, "node has both B and W"))
+
+    if movers and any(key in node.properties for key in ["AB", "AW", "AE"]):
+        problems.append(Problem(node, move_number, "node has both setup and a move"))
+
+    for adder, colour in [("AB", BLACK), ("AW", WHITE), ("AE", EMPTY)]:
+        for value in node.properties.get(adder, []):
+            for x, y in points_from_points_string(value, board.boardsize):
+                board.set_stone(colour, x, y)
+
+    for key in movers:
+
+        colour = BLACK if key == "B" else WHITE
+        values = node.properties[key]
+        move_number += 1
+
+        if len(values) > 1:
+            problems.append(Problem(node, move_number, "{} has {} values".format(key, len(values))))
+
+        movestring = values[0]
+
+        if movestring == "" or (movestring == "tt" and board.boardsize <= 19):
+            board.play_pass()
+            continue
+
+        x, y = -1, -1
+        if len(movestring) == 2:
+            x = ord(movestring[0]) - 96
+            y = ord(movestring[1]) - 96
+
+        if len(movestring) != 2 or x < 1 or x > board.boardsize or y < 1 or y > board.boardsize:
+            problems.append(Problem(node, move_number, "{}[{}] is not a point on the board".format(key, movestring), fixed = repair))
+            if repair:
+                node.set_value(key, "")
+            board.play_pass()
+            continue
+
+        i = board.index(x, y)
+
+        if board.state[i] != EMPTY:
+            problems.append(Problem(node, move_number, "{}[{}] is on an occupied point".format(key, movestring)))
+        elif i == board.ko:
+            problems.append(Problem(node, move_number, "{}[{}] retakes a ko".format(key, movestring)))
+
+        board.play_move(colour, x, y)
+
+        if board.state[i] != colour:
+            problems.append(Problem(node, move_number, "{}[{}] is suicide".format(key, movestring)))
+
+    return move_number
+
+
+def validate_tree(root, repair = False):            # Returns a list of Problems
+
+    problems = []
+
+    boardsize = check_boardsize(root, problems, repair)
+    if boardsize is None:
+        return problems
+
+    board = FastBoard(boardsize)
+    stack = [(root, 0)]
+
+    # Entries are (node, move number before it) to visit, or (None, mark) to undo back to a mark
+    # once every child below a node has been dealt with.
+
+    while stack:
+        node, n = stack.pop()
+        if node is None:
+            board.undo_to(n)
+            continue
+        mark = board.mark()
+        n = check_node(board, node, n, problems, repair)
+        if len(node.children) == 1:                 # No need to undo; nothing else needs this position
+            stack.append((node.children[0], n))
+        elif len(node.children) > 1:
+            stack.append((None, mark))
+            for child in reversed(node.children):
+                stack.append((child, n))
+
+    return problems
+
+
+def validate_file(filename, repair = False):        # Returns (root, list of Problems); root is None if the file can't be parsed
+
+    contents, fmt = read_source(filename)
+    problems = []
+
+    if fmt == SGF:
+        sgf = contents.strip().lstrip("(")
+        root, chars_read = load_sgf_tree(sgf, None)
+        if sgf[chars_read:].strip():
+            problems.append(Problem(None, 0, "{} characters after the game tree".format(len(sgf[chars_read:].strip())), fixed = repair))
+    else:
+        root = formats[fmt][0](contents)
+
+    problems += validate_tree(root, repair)
+    return root, problems
+
+
+def validate_task(path, repair_dir = None):         # Runs in a worker process
+    root, problems = validate_file(path, repair = repair_dir is not None)
+    repaired = None
+    if repair_dir and problems:
+        repaired = os.path.join(repair_dir, os.path.splitext(strip_compression_extension(os.path.basename(path)))[0] + ".sgf")
+        root.set_value("CA", "UTF-8")           # save_file() always writes UTF-8
+        save_file(repaired, root)
+    return {"problems": [problem.as_dict() for problem in problems], "repaired": repaired}
+
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description = "Replay every variation of game records, reporting illegal moves and other problems.")
+    parser.add_argument("target", help = "a file, or a directory to search")
+    parser.add_argument("--repair", default = None, metavar = "DIR", help = "write fixed copies of files with problems here")
+    parser.add_argument("--workers", type = int, default = None)
+    args = parser.parse_args()
+
+    if os.path.isdir(args.target):
+        paths = find_files(args.target)
+    else:
+        paths = [args.target]
+
+    if args.repair:
+        os.makedirs(args.repair, exist_ok = True)
+
+    throughput = Throughput()
+    bad_files = 0
+
+    for record in run_batch(functools.partial(validate_task, repair_dir = args.repair), paths, workers = args.workers):
+        throughput.add(record)
+        if not record["ok"]:
+            print("{}\t-\t-\tcould not be read: {}: {}".format(record["path"], record["error"], record["message"]))
+            continue
+        if record["problems"]:
+            bad_files += 1
+        for problem in record["problems"]:
+            print("{}\t{}\t{}\t{}{}".format(record["path"], problem["node"], problem["move"], problem["problem"], " (fixed)" if problem["fixed"] else ""))
+
+    throughput.report()
+    print("{} files with problems".format(bad_files), file = sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
 # The challenge of this is making a nice GUI while not having races where (e.g.) a new board
 # is created while the engine is thinking. I use the simplest solution of disallowing all
-# human action while we await the engine's next move.
+# human action while we await the engine's reply.
+#
+# The engine is driven by gofish.gtp on an asyncio loop in a second thread. Tk must only be
+# touched from the main thread, so finished requests are put in a queue, which the GUI checks
+# every POLL_MS milliseconds while (and only while) it is waiting for the engine.
 
-import os, queue, subprocess, sys, threading
+import asyncio, os, queue, sys, threading
 import tkinter, tkinter.filedialog, tkinter.messagebox
 
 import gofish
+import gofish.gtp
+import gofish.gtp_trace
 from gofish import BLACK, WHITE
 
 colour_lookup = {BLACK: "black", WHITE: "white"}
@@ -13,6 +19,8 @@ colour_lookup = {BLACK: "black", WHITE: "white"}
 WIDTH, HEIGHT = 621, 621
 GAP = 31
 
+POLL_MS = 10
+
 MOTD = """
   Fohristiwhirl's GTP relay.
 """
@@ -85,53 +93,6 @@ def title_bar_string(node):
 
 # --------------------------------------------------------------------------------------
 
-def send_command(command, verbose = True):
-
-    if len(command) == 0 or command[-1] != "\n":
-        command += "\n"
-
-    if verbose:
-        print(command, end="")
-
-    process.stdin.write(bytearray(command, encoding="ascii"))
-    process.stdin.flush()
-
-def get_reply(verbose = True):
-
-    response = ""
-
-    while 1:
-        newlinebytes = process.stdout.readline()
-        newline = str(newlinebytes, encoding="ascii")
-        newline = newline.replace("\r\n", "\n")             # is there a better way to deal with this Windows nonsense?
-
-        response += newline
-
-        if len(response) >= 2:
-            if response[-2:] == "\n\n":
-                response = response.strip()
-                if verbose:
-                    print(response)
-                return response
-
-def send_and_get(command):
-    send_command(command)
-    response = get_reply()
-    return response
-
-# This will get run in a thread, communicating with the rest of the program via queues...
-
-def relay():
-    while 1:
-        command = engine_in_queue.get()
-
-        send_command(command)
-        response = get_reply()
-
-        engine_out_queue.put(response)
-
-# --------------------------------------------------------------------------------------
-
 class GTP_GUI(tkinter.Canvas):
 
     def __init__(self, owner, *args, **kwargs):
@@ -144,65 +105,91 @@ class GTP_GUI(tkinter.Canvas):
         self.awaiting_move = False
         self.human_colour = BLACK
         self.engine_colour = WHITE
+        self.polling = False
 
-        self.reset(19)
 
-        self.engine_msg_poller()
+    def ask_engine(self, coroutine, callback, error_callback = None):
 
+        # Run the coroutine on the engine thread. When it finishes, callback is called (in
+        # this thread) with its result. Errors are printed and the GUI is released; if the
+        # engine refused the command, error_callback (if any) is called with the GTPError.
 
-    def reset(self, size):
+        def done(future):
+            replies.put((callback, error_callback, future))     # Tkinter must only be touched from its own thread
 
-        if self.awaiting_move:
-            return
+        asyncio.run_coroutine_threadsafe(coroutine, loop).add_done_callback(done)
+        self.need_to_wait()
 
-        self.node = gofish.new_tree(size)
+        if not self.polling:
+            self.polling = True
+            self.after(POLL_MS, self.engine_reply_poller)
 
-        for cmd in ["boardsize {}".format(self.node.board.boardsize), "clear_board", "komi 0"]:
-            send_command(cmd)
-            get_reply()
 
-        if self.human_colour == BLACK:
-            statusbar.config(text = "Your move ({})".format(colour_lookup[self.human_colour]))
+    def engine_reply_poller(self):
+        while 1:
+            try:
+                callback, error_callback, future = replies.get(block = False)
+            except queue.Empty:
+                break
+            self.done_waiting()
+            try:
+                result = future.result()
+            except gofish.gtp.GTPError as err:
+                print("ERROR: {}".format(err))
+                if error_callback:
+                    error_callback(err)
+                continue
+            except ConnectionError as err:
+                print("ERROR: {}".format(err))
+                continue
+            callback(result)
+        if self.awaiting_move:                      # Still waiting, perhaps on a request made by the callback
+            self.after(POLL_MS, self.engine_reply_poller)
         else:
-            command = "genmove {}".format(colour_lookup[self.engine_colour])
-            engine_in_queue.put(command)
-            self.need_to_wait()
+            self.polling = False
 
-        self.draw_node()
 
+    async def play_and_genmove(self, colour, x, y):     # The human's move (or pass, if x = y = 0), then the engine's
+        await engine.play(colour, x, y)
+        return await engine.genmove(self.engine_colour)
+
+
+    def reset(self, size):
 
-    def handicap(self, h):
         if self.awaiting_move:
             return
 
-        self.node = gofish.new_tree(self.node.board.boardsize)
+        self.node = gofish.new_tree(size)
+        self.draw_node()
 
-        for cmd in ["boardsize {}".format(self.node.board.boardsize), "clear_board", "komi 0"]:
-            send_command(cmd)
-            get_reply()
+        self.ask_engine(engine.new_game(size), self.new_game_handler)
 
-        send_command("fixed_handicap {}".format(h))
-        response = get_reply()
 
-        if response[0] == "?":
-            self.reset(self.node.board.boardsize)
+    def handicap(self, h):
+
+        if self.awaiting_move:
             return
 
-        self.node.set_value("HA", h)
+        self.node = gofish.new_tree(self.node.board.boardsize)
+        self.draw_node()
 
-        english_points_list = response[1:].strip().split()
-        for p in english_points_list:
-            x, y = gofish.point_from_english_string(p, self.node.board.boardsize)
-            self.node.add_stone(BLACK, x, y)
+        size = self.node.board.boardsize
+        self.ask_engine(engine.new_game(size, handicap = h), self.new_game_handler, lambda err : self.reset(size))     # e.g. handicap not supported
 
-        if self.human_colour == WHITE:      # The reverse of normal; white goes first
-            statusbar.config(text = "Your move ({})".format(colour_lookup[self.human_colour]))
-        else:
-            command = "genmove {}".format(colour_lookup[self.engine_colour])
-            engine_in_queue.put(command)
-            self.need_to_wait()
 
-        self.draw_node()
+    def new_game_handler(self, points):
+
+        if points:
+            self.node.set_value("HA", len(points))
+            for point in points:
+                if point in [gofish.gtp.PASS, gofish.gtp.RESIGN, None]:
+                    continue
+                self.node.add_stone(BLACK, point[0], point[1])
+            self.draw_node()
+
+        first = WHITE if points else BLACK          # With a handicap, white goes first
+        if self.human_colour != first:
+            self.ask_engine(engine.genmove(self.engine_colour), self.engine_move_handler)
 
 
     def mouseclick_handler(self, event):
@@ -216,64 +203,27 @@ class GTP_GUI(tkinter.Canvas):
             except gofish.IllegalMove:
                 return
 
-            command = "play {} {}".format(colour_lookup[self.human_colour], gofish.english_string_from_point(x, y, self.node.board.boardsize))
-            send_and_get(command)
-
-            command = "genmove {}".format(colour_lookup[self.engine_colour])
-            engine_in_queue.put(command)
-
-            self.need_to_wait()
-
             self.draw_node()
 
+            self.ask_engine(self.play_and_genmove(self.human_colour, x, y), self.engine_move_handler)
 
-    def engine_msg_poller(self):
-        self.after(100, self.engine_msg_poller)     # Add a callback here in 100 ms
-        self.engine_move_handler()
-
-    # We just use the poller to get engine moves. Everything else doesn't use the
-    # other thread to send and receive. Everything else will just block while
-    # waiting for a response.
-
-    def engine_move_handler(self):
-        try:
-            message = engine_out_queue.get(block = False)
-        except queue.Empty:
-            return
-        if message[0] != "=":
-            print("ERROR: {}".format(message))
-            return
 
-        if not self.awaiting_move:
-            print("ERROR: got '{}' while NOT expecting move".format(message))
-            return
+    def engine_move_handler(self, move):
 
         resign_flag = False
 
-        message = message[1:].strip()
-
-        if len(message) in [2,3]:
-            point = gofish.point_from_english_string(message, self.node.board.boardsize)
-            if point is None:
-                print("ERROR: got '{}' while expecting move".format(message))
-                return
-            else:
-                x, y = point
-            try:
-                result = self.node.make_move(x, y, colour = self.engine_colour)
-            except gofish.IllegalMove:
-                print("ERROR: got illegal move {}".format(message))
-                return
-        elif message.upper() == "PASS":
+        if move == gofish.gtp.PASS:
             result = self.node.make_pass()
-        elif message.upper() == "RESIGN":
+        elif move == gofish.gtp.RESIGN:
             result = self.node.make_pass()
             resign_flag = True
         else:
-            print("ERROR: got '{}' while expecting move".format(message))
-            return
-
-        self.done_waiting()
+            x, y = move
+            try:
+                result = self.node.make_move(x, y, colour = self.engine_colour)
+            except gofish.IllegalMove:
+                print("ERROR: got illegal move {}".format(gofish.english_string_from_point(x, y, self.node.board.boardsize)))
+                return
 
         self.node = result
 
@@ -292,10 +242,7 @@ class GTP_GUI(tkinter.Canvas):
 
         self.human_colour, self.engine_colour = self.engine_colour, self.human_colour
 
-        command = "genmove {}".format(colour_lookup[self.engine_colour])
-        engine_in_queue.put(command)
-
-        self.need_to_wait()
+        self.ask_engine(engine.genmove(self.engine_colour), self.engine_move_handler)
 
 
     def need_to_wait(self):     # Basically, prevent the user from doing anything
@@ -322,11 +269,13 @@ class GTP_GUI(tkinter.Canvas):
         if self.node.move_was_pass():
             if self.node.parent:
                 if self.node.parent.move_was_pass():
+                    self.ask_engine(engine.final_score(), self.final_score_handler)
                     statusbar.config(text = "Asking engine for score")
-                    statusbar.update_idletasks()
-                    msg = send_and_get("final_score")
-                    self.owner.wm_title("Score: " + msg[1:].strip())
-                    statusbar.config(text = "Score: " + msg[1:].strip())
+
+
+    def final_score_handler(self, score):
+        self.owner.wm_title("Score: " + score)
+        statusbar.config(text = "Score: " + score)
 
 
     def draw_node(self):
@@ -424,18 +373,10 @@ class GTP_GUI(tkinter.Canvas):
 
             self.node = self.node.make_pass()
 
-            colour_lookup = {BLACK: "black", WHITE: "white"}
-
-            command = "play {} pass".format(colour_lookup[self.human_colour])
-            send_and_get(command)
-
-            command = "genmove {}".format(colour_lookup[self.engine_colour])
-            engine_in_queue.put(command)
-
-            self.need_to_wait()
-
             self.draw_node()
 
+            self.ask_engine(self.play_and_genmove(self.human_colour, 0, 0), self.engine_move_handler)
+
 # ---------------------------------------------------------------------------------------
 
 
@@ -484,26 +425,41 @@ class Root(tkinter.Tk):
 
         self.config(menu = menubar)
 
+        board.reset(19)                     # Only now, since waiting on the engine disables parts of the menu
+
         self.wm_title("Fohristiwhirl's GTP relay")
 
 
 if __name__ == "__main__":
 
-    if len(sys.argv) < 2:
+    # Usage: python gtp_relay.py [--trace FILE] engine [engine arguments...]
+
+    engine_args = sys.argv[1:]
+    tracer = None
+
+    if engine_args[:1] == ["--trace"] and len(engine_args) > 1:
+        tracer = gofish.gtp_trace.Tracer(engine_args[1])        # A JSONL transcript of the GTP traffic, see gtp_trace.py
+        engine_args = engine_args[2:]
+
+    if len(engine_args) < 1:
         print("Need an argument: the engine to run (it may also require more arguments)")
         sys.exit(1)
 
-    global process
-    process = subprocess.Popen(args = sys.argv[1:], stdin = subprocess.PIPE, stdout = subprocess.PIPE)    #, stderr = subprocess.DEVNULL)
+    global loop
+    loop = asyncio.new_event_loop()
+    threading.Thread(target = loop.run_forever, daemon = True).start()     # The engine is only ever touched in this thread
 
-    global engine_in_queue
-    engine_in_queue = queue.Queue()
+    global engine
+    engine = gofish.gtp.Engine(engine_args, verbose = True, tracer = tracer)
+    asyncio.run_coroutine_threadsafe(engine.start(), loop).result()
 
-    global engine_out_queue
-    engine_out_queue = queue.Queue()
+    global replies
+    replies = queue.Queue()         # (callback, error_callback, future) for the GUI thread, see ask_engine()
 
     print(MOTD)
 
-    threading.Thread(target = relay, daemon = True).start()    # The relay actually talks to the engine
     app = Root()
     app.mainloop()
+
+    if tracer:
+        tracer.close()